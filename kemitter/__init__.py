@@ -1,2 +1,4 @@
 from . import basis, model
 from .obsrv.observation import Observation
+from .obsrv.stream import ObservationStream
+from .obsrv.calibration import Calibration
@@ -1,2 +1,3 @@
 from .isometric import IsometricEmitter
 from .oriented import OrientedEmitter
+from .operator import StructuredBasisOperator
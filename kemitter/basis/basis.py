@@ -1,6 +1,12 @@
+import copy
+import threading
+import weakref
 from abc import ABC, abstractmethod
 import numpy as np
 import scipy.sparse as sp
+from .operator import StructuredBasisOperator
+
+_cache_lock = threading.Lock()  # guards the column sum caches of bases shared between threads
 
 
 class Basis(ABC):
@@ -34,8 +40,20 @@ class Basis(ABC):
         self.is_built = False
         self.pol_angle = None
         self.basis_parameters = None
+        self._column_sum_cache = (None, {})  # (weak reference to the basis matrix, column sums by row range)
         super().__init__()
 
+    def __getstate__(self):
+        # cached column sums are not pickled, since they hold a weak reference to the basis matrix
+        state = self.__dict__.copy()
+        state['_column_sum_cache'] = (None, {})
+        return state
+
+    def __setstate__(self, state):
+        # bases pickled before column sums were cached have no cache attribute
+        self.__dict__.update(state)
+        self.__dict__.setdefault('_column_sum_cache', (None, {}))
+
     @property
     def is_defined(self):
         """bool: whether or not all basis parameters have been properly defined and the basis is ready to be built."""
@@ -67,6 +85,27 @@ class Basis(ABC):
             print("Geometric and optical parameters must be defined prior to loading of "
                   "observation-dependent parameters.")
 
+    def observation_copy(self, wavelength, k_count):
+        """Creates an unbuilt copy of the basis with new observation-dependent parameters.
+
+        The geometric and optical parameters are shared with this basis, while the wavelength mapping and momentum grid
+        size are redefined, e.g. to fit a binned version of the observation. The slit type is kept.
+
+        Args:
+            wavelength (ndarray): 1D array of wavelength mapping values of the copy.
+            k_count (int): the image size in the momentum dimension of the copy.
+
+        Returns (Basis):
+            The new basis, ready to be built.
+        """
+        basis = copy.copy(self)
+        basis.basis_parameters = copy.copy(self.basis_parameters)
+        basis.basis_matrix = None
+        basis._column_sum_cache = (None, {})
+        basis.is_built = False
+        basis.define_observation_parameters(wavelength, k_count, open_slit=self.basis_parameters.ux_count > 1)
+        return basis
+
     def sparse_column_major_offset(self, matrix):
         # flatten data matrix by column
         flattened_length = self.basis_parameters.ux_count * self.basis_parameters.uy_count * \
@@ -75,10 +114,93 @@ class Basis(ABC):
         # load into sparse matrix
         return sp.csc_matrix((flat_matrix, (self.sparse_rows(), self.sparse_cols())))
 
+    def as_operator(self):
+        """Returns a matrix-free view of the built basis.
+
+        The view holds a copy of the basis function patterns, about the size of the basis matrix, so it is built on
+        each call and should be released when no longer needed.
+
+        Returns (StructuredBasisOperator):
+            A ``LinearOperator`` storing only the dense basis function patterns, with parallel ``matvec``,
+            ``rmatvec``, column sum and Gram kernels.
+
+        Raises:
+            RuntimeError: if the basis has not been built.
+        """
+        if not self.is_built:
+            raise RuntimeError("Basis must be built before it can be viewed as an operator.")
+        return StructuredBasisOperator.from_matrix(self.basis_matrix, self.basis_parameters.wavelength_count,
+                                                   self.basis_parameters.ux_count, self.basis_parameters.uy_count,
+                                                   self._row_offset())
+
+    def column_sums(self, begin=None, end=None):
+        """Sums each basis function over a range of rows of the built basis matrix.
+
+        Sums are computed in a single pass over the stored nonzeros, without slicing the matrix, and are cached for
+        each row range until the basis matrix is replaced. The cache is guarded by a lock, so a basis can be shared by
+        fits running in several threads.
+
+        Args:
+            begin (int or None): the first row of the range [default None, the first row].
+            end (int or None): one past the last row of the range [default None, past the last row].
+
+        Returns (ndarray):
+            1D read-only array with one sum per column of the basis matrix.
+        """
+        with _cache_lock:
+            matrix_ref, cache = self._column_sum_cache
+            if matrix_ref is None or matrix_ref() is not self.basis_matrix:
+                cache = {}
+                self._column_sum_cache = (weakref.ref(self.basis_matrix), cache)
+            sums = cache.get((begin, end))
+        if sums is None:
+            matrix = sp.csc_matrix(self.basis_matrix)
+            data = matrix.data
+            if begin is not None or end is not None:
+                rows = matrix.indices
+                data = np.where((rows >= (begin or 0)) & (rows < (matrix.shape[0] if end is None else end)), data, 0)
+            cumulative = np.concatenate(([0.0], np.cumsum(data)))
+            sums = cumulative[matrix.indptr[1:]] - cumulative[matrix.indptr[:-1]]
+            sums.setflags(write=False)
+            with _cache_lock:
+                cache[(begin, end)] = sums
+        return sums
+
+    def column_pixels(self):
+        """Maps each basis column to the observation pixel column at the center of its basis function.
+
+        Returns (ndarray):
+            1D integer array with one entry per wavelength (column) of a single basis type. Columns introduced by
+            wavelength padding map to pixel indices outside of the observation.
+        """
+        shift = self._row_offset() // self.basis_parameters.uy_count
+        return np.arange(self.basis_parameters.wavelength_count) - shift + self.basis_parameters.ux_count // 2
+
+    def window_indices(self, begin, end):
+        """Finds the basis matrix rows and columns involved in a window of observation pixel columns.
+
+        The window is given in pixel columns (wavelength indices) of the observation. The returned columns include
+        every basis function that overlaps the window, including those centered outside of it whose patterns bleed
+        into the window edges.
+
+        Args:
+            begin (int): the first pixel column of the window.
+            end (int): one past the last pixel column of the window.
+
+        Returns (tuple of (slice, ndarray)):
+            The row slice of the basis matrix covering the window, and the sorted column indices (across all basis
+            types) of the basis functions that overlap it.
+        """
+        uy_count = self.basis_parameters.uy_count
+        ux_count = self.basis_parameters.ux_count
+        w_count = self.basis_parameters.wavelength_count
+        shift = self._row_offset() // uy_count
+        j = np.arange(max(0, begin - ux_count + 1 + shift), min(w_count, end + shift))
+        cols = (np.arange(len(self.basis_names))[:, None] * w_count + j[None, :]).ravel()
+        return slice(begin * uy_count, end * uy_count), cols
+
     def basis_trim(self, matrix):
-        begin_ind = int(self.basis_parameters.uy_count * np.floor(self.basis_parameters.ux_count/2))
-        if self.basis_parameters.pad_w:
-            begin_ind += int(self.basis_parameters.uy_count * np.floor((self.basis_parameters.ux_count - 1)/2))
+        begin_ind = self._row_offset()
 
         final_pix_row_ind = matrix.shape[0] - 1
         end_ind = int(final_pix_row_ind - self.basis_parameters.uy_count * np.floor((self.basis_parameters.ux_count - 1)/2))
@@ -87,6 +209,15 @@ class Basis(ABC):
 
         return matrix[begin_ind:(end_ind+1), :]
 
+    def _row_offset(self):
+        # number of leading rows of the untrimmed basis matrix that are removed by wavelength trimming
+        if not self.basis_parameters.trim_w:
+            return 0
+        begin_ind = int(self.basis_parameters.uy_count * np.floor(self.basis_parameters.ux_count/2))
+        if self.basis_parameters.pad_w:
+            begin_ind += int(self.basis_parameters.uy_count * np.floor((self.basis_parameters.ux_count - 1)/2))
+        return begin_ind
+
     def sparse_rows(self): # , ux_count, uy_count, wavelength_count):
         single_wavelength_rows = np.arange(0, self.basis_parameters.ux_count * self.basis_parameters.uy_count)
         offset = np.arange(0, self.basis_parameters.uy_count * self.basis_parameters.wavelength_count, self.basis_parameters.uy_count)
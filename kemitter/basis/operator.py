@@ -0,0 +1,198 @@
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.linalg import LinearOperator
+from numba import jit, prange
+
+
+class StructuredBasisOperator(LinearOperator):
+    """Matrix-free representation of a built basis matrix.
+
+    Every column of a built basis holds a single dense momentum-space pattern of ``ux_count * uy_count`` values,
+    shifted down by ``uy_count`` rows per wavelength. Rather than storing the basis as a generic sparse matrix with
+    row and column index arrays, this operator stores only the ``(n_columns, ux_count * uy_count)`` array of patterns
+    and implements the matrix products with parallel `numba` kernels that walk the patterns contiguously.
+
+    The operator is compatible with ``scipy.sparse.linalg.LinearOperator`` and can be passed directly to iterative
+    solvers such as ``lsqr`` or ``cg``.
+
+    Attributes:
+        patterns (ndarray): 2D C-contiguous array whose rows are the (untrimmed) basis function patterns, in the
+            column order of the basis matrix.
+        block_size (int): the number of columns (wavelengths) belonging to each basis type.
+        uy_count (int): the number of samples in the y-momentum dimension, i.e. the row shift per wavelength.
+        row_offset (int): the number of leading rows removed from the untrimmed basis matrix by wavelength trimming.
+
+    See Also:
+        :func:`~kemitter.basis.basis.Basis.as_operator`
+    """
+    def __init__(self, patterns, block_size, uy_count, row_offset, row_count):
+        self.patterns = np.ascontiguousarray(patterns, dtype=np.float64)
+        self.block_size = int(block_size)
+        self.uy_count = int(uy_count)
+        self.row_offset = int(row_offset)
+        if self.patterns.shape[1] % self.uy_count or self.row_offset % self.uy_count or row_count % self.uy_count:
+            raise ValueError('Pattern length, row offset and row count must be multiples of uy_count.')
+        super().__init__(np.float64, (int(row_count), self.patterns.shape[0]))
+
+    @classmethod
+    def from_matrix(cls, matrix, block_size, ux_count, uy_count, row_offset):
+        """Builds the operator by gathering the patterns out of a sparse basis matrix.
+
+        Args:
+            matrix (spmatrix): a built basis matrix.
+            block_size (int): the number of columns belonging to each basis type.
+            ux_count (int): the number of samples in the x-momentum dimension.
+            uy_count (int): the number of samples in the y-momentum dimension.
+            row_offset (int): the number of leading rows trimmed from the basis matrix.
+
+        Returns (StructuredBasisOperator):
+            The structured equivalent of ``matrix``.
+        """
+        matrix = sp.csc_matrix(matrix)
+        patterns = np.zeros((matrix.shape[1], ux_count * uy_count))
+        # the patterns are gathered column by column, without any temporary index arrays
+        _gather_patterns(matrix.indptr, matrix.indices, matrix.data, patterns, block_size, uy_count, row_offset)
+        return cls(patterns, block_size, uy_count, row_offset, matrix.shape[0])
+
+    @property
+    def ux_count(self):
+        """int: the number of samples in the x-momentum dimension, i.e. the wavelength span of each pattern."""
+        return self.patterns.shape[1] // self.uy_count
+
+    def column_sums(self):
+        """Sums each basis function over the rows retained in the (trimmed) basis matrix.
+
+        Returns (ndarray):
+            1D array with one sum per column, equal to ``np.asarray(basis_matrix.sum(axis=0)).ravel()``.
+        """
+        return _column_sums(self.patterns, self.block_size, self.uy_count, self.row_offset, self.shape[0])
+
+    def gram(self):
+        """Forms the banded Gram matrix (A^T*A) of the basis.
+
+        Columns only overlap when their wavelengths lie within ``ux_count`` of each other, so only that band (for
+        every pair of basis types) is evaluated.
+
+        Returns (csc_matrix):
+            The sparse ``n_columns X n_columns`` Gram matrix.
+        """
+        band = _gram_band(self.patterns, self.block_size, self.uy_count, self.row_offset, self.shape[0])
+        n, block_count, width = band.shape
+        j = np.arange(n) % self.block_size
+        j2 = j[:, None, None] + np.arange(width)[None, None, :] - (self.ux_count - 1)
+        other = np.arange(block_count)[None, :, None] * self.block_size + j2
+        rows = np.broadcast_to(np.arange(n)[:, None, None], band.shape)
+        keep = np.broadcast_to((j2 >= 0) & (j2 < self.block_size), band.shape)
+        return sp.csc_matrix((band[keep], (rows[keep], other[keep])), shape=(n, n))
+
+    def toarray(self):
+        """Returns (ndarray): the dense equivalent of the basis matrix (for small bases and testing only)."""
+        return self.matmat(np.identity(self.shape[1]))
+
+    def _matvec(self, x):
+        x = np.ascontiguousarray(np.ravel(x), dtype=np.float64)
+        return _matvec(self.patterns, x, self.block_size, self.uy_count, self.row_offset, self.shape[0])
+
+    def _rmatvec(self, y):
+        y = np.ascontiguousarray(np.ravel(y), dtype=np.float64)
+        return _rmatvec(self.patterns, y, self.block_size, self.uy_count, self.row_offset, self.shape[0])
+
+    def _adjoint(self):
+        return _AdjointStructuredBasisOperator(self)
+
+
+class _AdjointStructuredBasisOperator(LinearOperator):
+    def __init__(self, operator):
+        self.operator = operator
+        super().__init__(np.float64, (operator.shape[1], operator.shape[0]))
+
+    def _matvec(self, y):
+        return self.operator._rmatvec(y)
+
+    def _rmatvec(self, x):
+        return self.operator._matvec(x)
+
+    def _adjoint(self):
+        return self.operator
+
+
+@jit(nopython=True, parallel=True)
+def _gather_patterns(indptr, indices, data, patterns, block_size, uy_count, row_offset):
+    for c in prange(patterns.shape[0]):
+        start = (c % block_size) * uy_count - row_offset
+        for k in range(indptr[c], indptr[c + 1]):
+            patterns[c, indices[k] - start] = data[k]
+
+
+@jit(nopython=True, parallel=True)
+def _matvec(patterns, x, block_size, uy_count, row_offset, row_count):
+    # each output pixel column (a group of uy_count rows) is owned by one thread, so no write conflicts occur
+    y = np.zeros(row_count)
+    ux_count = patterns.shape[1] // uy_count
+    shift = row_offset // uy_count
+    block_count = patterns.shape[0] // block_size
+    for p in prange(row_count // uy_count):
+        for b in range(block_count):
+            for j in range(max(0, p + shift - ux_count + 1), min(block_size, p + shift + 1)):
+                c = b * block_size + j
+                xc = x[c]
+                if xc != 0.0:
+                    k0 = (p + shift - j) * uy_count
+                    for i in range(uy_count):
+                        y[p * uy_count + i] += patterns[c, k0 + i] * xc
+    return y
+
+
+@jit(nopython=True, parallel=True)
+def _rmatvec(patterns, y, block_size, uy_count, row_offset, row_count):
+    n = patterns.shape[0]
+    length = patterns.shape[1]
+    x = np.zeros(n)
+    for c in prange(n):
+        start = (c % block_size) * uy_count - row_offset
+        acc = 0.0
+        for k in range(max(0, -start), min(length, row_count - start)):
+            acc += patterns[c, k] * y[start + k]
+        x[c] = acc
+    return x
+
+
+@jit(nopython=True, parallel=True)
+def _column_sums(patterns, block_size, uy_count, row_offset, row_count):
+    n = patterns.shape[0]
+    length = patterns.shape[1]
+    sums = np.zeros(n)
+    for c in prange(n):
+        start = (c % block_size) * uy_count - row_offset
+        acc = 0.0
+        for k in range(max(0, -start), min(length, row_count - start)):
+            acc += patterns[c, k]
+        sums[c] = acc
+    return sums
+
+
+@jit(nopython=True, parallel=True)
+def _gram_band(patterns, block_size, uy_count, row_offset, row_count):
+    # band[c, b, d] holds the inner product of column c with column (b * block_size + j + d - (ux_count - 1))
+    n = patterns.shape[0]
+    length = patterns.shape[1]
+    ux_count = length // uy_count
+    block_count = n // block_size
+    band = np.zeros((n, block_count, 2 * ux_count - 1))
+    for c in prange(n):
+        j = c % block_size
+        start = j * uy_count - row_offset
+        for b in range(block_count):
+            for d in range(2 * ux_count - 1):
+                j2 = j + d - (ux_count - 1)
+                if j2 < 0 or j2 >= block_size:
+                    continue
+                c2 = b * block_size + j2
+                start2 = j2 * uy_count - row_offset
+                lo = max(max(start, start2), 0)
+                hi = min(min(start, start2) + length, row_count)
+                acc = 0.0
+                for r in range(lo, hi):
+                    acc += patterns[c, r - start] * patterns[c2, r - start2]
+                band[c, b, d] = acc
+    return band
@@ -1,2 +1,9 @@
 from .ridge import Ridge
-from .quadratic import Quadratic
\ No newline at end of file
+from .quadratic import Quadratic
+from .selection import compare_models, CandidateFit
+from .uncertainty import bootstrap, RateUncertainty
+from .fitting import fit, FitResult
+from .options import SolverOptions
+from .batch import BasisStore, fit_many
+from .store import ResultStore, basis_fingerprint
+from .watch import AcquisitionWatcher
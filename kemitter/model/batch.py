@@ -0,0 +1,210 @@
+import os
+import copy
+import pickle
+import tempfile
+import time
+import traceback
+import numpy as np
+import scipy.sparse as sp
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from .model import smoothness_operator
+from .stacked import StackedSystem
+from .quadratic import Quadratic, gram
+from .fitting import _fit
+
+_worker_state = None  # (store path, model, attached bases and Gram matrices, windowed Gram matrices) of a worker
+
+
+class BasisStore(object):
+    """Directory of built bases published once and attached by any number of processes without copying.
+
+    Each basis matrix is written as raw ``.npy`` arrays, which worker processes memory-map read-only. The operating
+    system then shares the same physical pages between all workers, so attaching a multi-GB basis costs neither
+    pickling nor memory. The regularized Gram matrix of a ``Quadratic`` model can be published alongside the bases.
+
+    Attributes:
+        path (str): the directory holding the published bases.
+    """
+    def __init__(self, path=None):
+        self.path = tempfile.mkdtemp(prefix='kemitter-bases-') if path is None else path
+        os.makedirs(self.path, exist_ok=True)
+
+    @property
+    def keys(self):
+        """list of str: the keys of the published basis sets."""
+        return sorted(name for name in os.listdir(self.path) if os.path.isfile(self._file(name, 'bases.pkl')))
+
+    def publish(self, key, bases, model=None):
+        """Writes a set of built bases (one per polarization) to the store.
+
+        Args:
+            key (str): the name of the basis set, used by jobs to refer to it.
+            bases (list of Basis): the built bases, with observation parameters defined.
+            model (Model or None): a ``Quadratic`` model whose regularized Gram matrix (A^T*A + alpha^2*D^T*D) of the
+                bases is published as well, along with the ``alpha``, ``order`` and ``weighted`` it was formed with
+                [default None, no Gram matrix].
+        """
+        if not isinstance(bases, list):
+            bases = [bases]
+        os.makedirs(os.path.join(self.path, key), exist_ok=True)
+        stripped = []
+        shapes = []
+        for i, basis in enumerate(bases):
+            if not basis.is_built:
+                raise ValueError('Basis of polarization angle {0} must be built before publishing.'.format(
+                    basis.pol_angle))
+            matrix = sp.csc_matrix(basis.basis_matrix)
+            for name in ('data', 'indices', 'indptr'):
+                np.save(self._file(key, 'basis{0}_{1}.npy'.format(i, name)), getattr(matrix, name))
+            basis = copy.copy(basis)
+            basis.basis_matrix = None
+            stripped.append(basis)
+            shapes.append(matrix.shape)
+        setup = None
+        if isinstance(model, Quadratic):
+            A = StackedSystem([basis.basis_matrix for basis in bases])
+            D = smoothness_operator(bases[0], model.order, model.weighted)
+            np.save(self._file(key, 'gram.npy'), gram(A, D, model.alpha))
+            setup = _gram_setup(model)
+        with open(self._file(key, 'bases.pkl'), 'wb') as f:
+            pickle.dump((stripped, shapes, setup), f)
+
+    def attach(self, key, model=None):
+        """Maps a published basis set into memory, read-only.
+
+        Args:
+            key (str): the name of the basis set.
+            model (Model or None): the model the bases are fit with. The published Gram matrix is only returned if it
+                was formed for a ``Quadratic`` model with the same ``alpha``, ``order`` and ``weighted`` [default None,
+                return any published Gram matrix].
+
+        Returns (tuple of (list of Basis, ndarray or None)):
+            The built bases, whose basis matrices reference the memory-mapped arrays, and the memory-mapped
+            regularized Gram matrix if one was published (and matches the model).
+        """
+        with open(self._file(key, 'bases.pkl'), 'rb') as f:
+            bases, shapes, setup = pickle.load(f)
+        for i, (basis, shape) in enumerate(zip(bases, shapes)):
+            arrays = [np.load(self._file(key, 'basis{0}_{1}.npy'.format(i, name)), mmap_mode='r')
+                      for name in ('data', 'indices', 'indptr')]
+            basis.basis_matrix = sp.csc_matrix(tuple(arrays), shape=shape, copy=False)
+        gram_file = self._file(key, 'gram.npy')
+        P = None
+        if os.path.isfile(gram_file) and (model is None or _gram_setup(model) == setup):
+            P = np.load(gram_file, mmap_mode='r')
+        return bases, P
+
+    def _file(self, key, name):
+        return os.path.join(self.path, key, name)
+
+
+def fit_many(model, store, jobs, processes=None, retries=1, numba_threads=1, wavelength_range=None,
+             max_pending=None, fits=False):
+    """Fits many observations in parallel processes against bases published in a store.
+
+    Each job names a published basis set and gives the observations (one per polarization) to fit against it. Worker
+    processes attach every basis set they need once, zero-copy (see :class:`BasisStore`), and reuse a published Gram
+    matrix for ``Quadratic`` models. With a ``wavelength_range``, the published Gram matrix of the full system does
+    not apply, so each worker forms the Gram matrix of the windowed system of a basis set on its first job and reuses
+    it for the later jobs of that basis set. Failed jobs are retried, and results are yielded in the order of the jobs while
+    at most ``max_pending`` jobs are in flight, so ``jobs`` can be a lazy iterable over a large campaign.
+
+    Args:
+        model (Model): the model defining the problem. Only its hyperparameters and solver options are used.
+        store (BasisStore): the store holding the published bases.
+        jobs (iterable of tuple): ``(key, observations)`` pairs.
+        processes (int or None): the number of worker processes [default None, one per core].
+        retries (int): the number of times a failed job is resubmitted [default 1].
+        numba_threads (int or None): the number of `numba` threads of each worker, so that the workers do not
+            oversubscribe the cores [default 1, None leaves the `numba` default]. Ignored by `numba` versions before
+            0.49, which cannot change it at run time.
+        wavelength_range (tuple of float or None): the (min, max) wavelengths to fit [default None, fit the full
+            observation].
+        max_pending (int or None): the maximum number of jobs in flight [default None, four per worker].
+        fits (bool): whether to reconstruct (and send back) the fit images of every result [default False].
+
+    Yields (FitResult or None):
+        The result of every job, in order, or None if the solver failed or the job failed after all retries.
+    """
+    processes = processes or os.cpu_count() or 1
+    max_pending = max_pending or 4 * processes
+    solver = model._solver_copy()
+    t0 = time.time()
+    jobs = enumerate(jobs)
+    pending = {}
+    finished = {}
+    attempts = {}
+    next_index = 0
+    exhausted = False
+    # workers are set up by their first job, since process pool initializers require Python 3.7
+    setup = (store, solver, numba_threads)
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        while True:
+            while not exhausted and len(pending) < max_pending:
+                try:
+                    index, (key, observations) = next(jobs)
+                except StopIteration:
+                    exhausted = True
+                    break
+                attempts[index] = 0
+                future = pool.submit(_fit_job, setup, key, observations, wavelength_range, fits)
+                pending[future] = (index, key, observations)
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, key, observations = pending.pop(future)
+                try:
+                    finished[index] = future.result()
+                except Exception:
+                    if attempts[index] < retries:
+                        attempts[index] += 1
+                        print('    Job {0} failed, retrying ({1} of {2})'.format(index, attempts[index], retries))
+                        retry = pool.submit(_fit_job, setup, key, observations, wavelength_range, fits)
+                        pending[retry] = (index, key, observations)
+                        continue
+                    print('    Job {0} failed:\n{1}'.format(index, traceback.format_exc()))
+                    finished[index] = None
+            while next_index in finished:
+                attempts.pop(next_index)
+                yield finished.pop(next_index)
+                next_index += 1
+    print('Batch fitting DONE:\n    {0} jobs in {1:.2f} s'.format(next_index, time.time() - t0))
+
+
+def _init_worker(store, model, numba_threads):
+    global _worker_state
+    if numba_threads is not None:
+        import numba
+        # numba only supports changing its thread count at run time from version 0.49
+        if hasattr(numba, 'set_num_threads'):
+            numba.set_num_threads(numba_threads)
+    _worker_state = (store.path, model, {}, {})
+
+
+def _fit_job(setup, key, observations, wavelength_range, fits):
+    store = setup[0]
+    if _worker_state is None or _worker_state[0] != store.path:
+        _init_worker(*setup)
+    _, model, attached, windowed = _worker_state
+    if key not in attached:
+        attached[key] = store.attach(key, model)
+    bases, P = attached[key]
+    if P is None:
+        return _fit(model, bases, observations, wavelength_range=wavelength_range, fits=fits)
+    if wavelength_range is None:
+        model.cache = P
+        return _fit(model, bases, observations, fits=fits, caching=True)
+    # the window of a basis set is fixed by its wavelengths, so its Gram matrix is formed once per worker
+    window_key = (key, tuple(wavelength_range))
+    model.cache = windowed.get(window_key)
+    result = _fit(model, bases, observations, wavelength_range=wavelength_range, fits=fits, caching=True)
+    windowed[window_key] = model.cache
+    return result
+
+
+def _gram_setup(model):
+    # the hyperparameters a published Gram matrix depends on, or None for models that do not use one
+    if not isinstance(model, Quadratic):
+        return None
+    return model.alpha, model.order, model.weighted
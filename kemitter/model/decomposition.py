@@ -0,0 +1,101 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+
+def window_ranges(pixel_count, windows, overlap):
+    """Splits the wavelength (pixel column) axis of an observation into overlapping windows.
+
+    Args:
+        pixel_count (int): the number of pixel columns in the observation.
+        windows (int): the number of windows.
+        overlap (int): the number of pixel columns each window extends past its core on either side.
+
+    Returns (list of tuple of int):
+        One ``(begin, end, core_begin, core_end)`` tuple per window. The cores partition ``[0, pixel_count)``, while
+        ``[begin, end)`` is the core extended by ``overlap`` and clipped to the observation.
+    """
+    if windows < 1 or windows > pixel_count:
+        raise ValueError('Number of windows must be between 1 and {0}, not {1}.'.format(pixel_count, windows))
+    edges = np.round(np.linspace(0, pixel_count, windows + 1)).astype(int)
+    return [(max(0, edges[i] - overlap), min(pixel_count, edges[i + 1] + overlap), edges[i], edges[i + 1])
+            for i in range(windows)]
+
+
+def blend_weights(centers, window, pixel_count):
+    """Computes the stitching weight of each basis column for one window.
+
+    Weights are 1 for columns centered within the window core and fall linearly to 0 across the overlap, so that the
+    weights of all windows form a partition of unity after normalization. Columns centered outside of the
+    observation (wavelength padding) are weighted as if centered on the nearest edge pixel.
+
+    Args:
+        centers (ndarray): the center pixel column of each basis column.
+        window (tuple of int): the ``(begin, end, core_begin, core_end)`` window definition.
+        pixel_count (int): the number of pixel columns in the observation.
+
+    Returns (ndarray):
+        1D array of non-negative weights, one per entry of ``centers``.
+    """
+    begin, end, core_begin, core_end = window
+    c = np.clip(centers, 0, pixel_count - 1) + 0.5
+    rise = np.clip((c - begin) / (core_begin - begin), 0, 1) if core_begin > begin else np.ones_like(c)
+    fall = np.clip((end - c) / (end - core_end), 0, 1) if end > core_end else np.ones_like(c)
+    return np.minimum(rise, fall) * ((c > begin) & (c < end))
+
+
+def solve_windows(model, systems, processes=None, verbose=False):
+    """Solves a set of independent window sub-problems, in parallel processes if requested.
+
+    Args:
+        model (Model): a (data-free) model whose ``_solve()`` routine is used for each window.
+        systems (list of tuple): ``(A, b, D)`` sub-problems, as accepted by ``model._solve()``.
+        processes (int or None): the number of worker processes. ``1`` solves the windows serially in the current
+            process, ``None`` uses one process per core [default None].
+        verbose (bool): the console verbosity of the called solver [default False].
+
+    Returns (list of tuple of (ndarray or None, str)):
+        The solution of each window (with its background term last), or None where the solver failed, together with
+        its solve status.
+    """
+    if processes == 1 or len(systems) == 1:
+        return [model._solve(A, b, D, verbose) for A, b, D in systems]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(_solve_window, model, A, b, D, verbose) for A, b, D in systems]
+        return [future.result() for future in futures]
+
+
+def decomposition_deviation(model, windows, overlap=None, iterations=0, processes=1, verbose=False):
+    """Compares the decomposed solution of a model to its monolithic solution.
+
+    Both problems are solved for the bases and observations loaded in the model, so this check is meant for small
+    problems (e.g. a coarse basis over a short spectrum), to choose the ``windows``, ``overlap`` and ``iterations`` of
+    larger runs. The model's own solution is not modified.
+
+    Args:
+        model (Model): the model, with bases and observations loaded (e.g. by a previous ``run()``).
+        windows (int): the number of wavelength windows.
+        overlap (int or None): the number of pixel columns each window extends past its core on either side
+            [default None, the momentum grid size ``ux_count``].
+        iterations (int): the number of Schwarz refinement iterations [default 0].
+        processes (int or None): the number of worker processes solving the windows [default 1, solve serially].
+        verbose (bool): the console verbosity of the called solver [default False].
+
+    Returns (float or None):
+        The largest absolute deviation of the stitched solution (rates and background) from the monolithic solution,
+        relative to the largest absolute value of the monolithic solution, or None if either solve failed.
+
+    Raises:
+        ValueError: if no bases or observations are loaded in the model.
+    """
+    if model.is_empty:
+        raise ValueError('Bases and observations must be loaded in the model before comparing solutions.')
+    A, b, D = model._system()
+    full, _ = model._solver_copy()._solve(A, b, D, verbose)
+    stitched, _ = model._solve_decomposed(windows, overlap, processes, iterations, verbose)
+    if full is None or stitched is None:
+        return None
+    return np.abs(stitched - full).max() / max(np.abs(full).max(), np.finfo(float).tiny)
+
+
+def _solve_window(model, A, b, D, verbose):
+    return model._solve(A, b, D, verbose)
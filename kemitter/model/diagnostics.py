@@ -0,0 +1,89 @@
+import numpy as np
+import scipy.sparse as sp
+from numba import jit, prange
+
+
+class FitDiagnostics(object):
+    """Goodness-of-fit summary of a solved model.
+
+    All quantities are computed from the basis matrices, observations and solved variables directly, without
+    reconstructing fit images (see :func:`~kemitter.model.model.Model.diagnostics`).
+
+    Attributes:
+        residual_norm (float): the 2-norm of the fit residual over all polarizations, ``||Ax + eta - b||``.
+        residual_norms (dict): the residual 2-norm of each polarization, keyed by polarization angle.
+        residual_profiles (dict): 1D arrays of the squared residual summed over each observation pixel column (i.e.
+            per wavelength), keyed by polarization angle.
+        chi_square (float): the sum of squared residuals weighted by the shot noise variance of each pixel, estimated
+            as ``max(b, 1)`` counts.
+        reduced_chi_square (float): ``chi_square`` divided by the number of degrees of freedom.
+        n_samples (int): the number of fitted pixels over all polarizations.
+        n_parameters (int): the number of solved variables.
+        contributions (dict): for each polarization angle, a dict containing 1D arrays of the wavelength-dependent
+            counts contributed by each basis type.
+    """
+    def __init__(self, residual_profiles, chi_square_profiles, n_samples, n_parameters, contributions):
+        self.residual_profiles = residual_profiles
+        self.residual_norms = {angle: np.sqrt(profile.sum()) for angle, profile in residual_profiles.items()}
+        self.residual_norm = np.sqrt(sum(profile.sum() for profile in residual_profiles.values()))
+        self.n_samples = n_samples
+        self.chi_square = float(sum(profile.sum() for profile in chi_square_profiles.values()))
+        self.n_parameters = n_parameters
+        self.reduced_chi_square = self.chi_square / max(self.n_samples - n_parameters, 1)
+        self.contributions = contributions
+
+
+def residual_profiles(basis_matrix, x, background, observation, block_size, ux_count, shift, begin, end):
+    """Computes per-pixel-column residual sums of a fit in a single fused pass over the basis matrix.
+
+    The fit is evaluated one observation pixel column at a time into a buffer of ``uy_count`` values, so the full fit
+    image is never materialized.
+
+    Args:
+        basis_matrix (spmatrix): the built (trimmed) basis matrix of one polarization.
+        x (ndarray): 1D array of the solved rates of every basis column.
+        background (float): the solved constant background term.
+        observation (ndarray): the 2D observation image.
+        block_size (int): the number of columns belonging to each basis type.
+        ux_count (int): the number of samples in the x-momentum dimension.
+        shift (int): the number of pixel columns trimmed from the start of the untrimmed basis.
+        begin (int): the first observation pixel column to evaluate.
+        end (int): one past the last observation pixel column to evaluate.
+
+    Returns (tuple of ndarray):
+        The squared residual and the shot-noise weighted squared residual summed over each pixel column.
+    """
+    basis_matrix = sp.csc_matrix(basis_matrix)
+    if not basis_matrix.has_sorted_indices:
+        basis_matrix = basis_matrix.sorted_indices()
+    return _residual_profiles(basis_matrix.indptr, basis_matrix.indices, basis_matrix.data,
+                              np.ascontiguousarray(x, dtype=np.float64), float(background),
+                              observation, block_size, ux_count, observation.shape[0], shift, begin, end)
+
+
+@jit(nopython=True, parallel=True)
+def _residual_profiles(indptr, indices, data, x, background, observation, block_size, ux_count, uy_count, shift,
+                       begin, end):
+    count = end - begin
+    block_count = (len(indptr) - 1) // block_size
+    rss = np.zeros(count)
+    chi = np.zeros(count)
+    for i in prange(count):
+        p = begin + i
+        row0 = p * uy_count
+        fit = np.full(uy_count, background)
+        for b in range(block_count):
+            for j in range(max(0, p + shift - ux_count + 1), min(block_size, p + shift + 1)):
+                c = b * block_size + j
+                xc = x[c]
+                if xc == 0.0:
+                    continue
+                k = indptr[c] + np.searchsorted(indices[indptr[c]:indptr[c + 1]], row0)
+                while k < indptr[c + 1] and indices[k] < row0 + uy_count:
+                    fit[indices[k] - row0] += data[k] * xc
+                    k += 1
+        for r in range(uy_count):
+            residual = fit[r] - observation[r, p]
+            rss[i] += residual * residual
+            chi[i] += residual * residual / max(observation[r, p], 1.0)
+    return rss, chi
@@ -0,0 +1,144 @@
+import time
+from types import MappingProxyType
+import numpy as np
+from .model import check_data_sets, system, wavelength_window, process_result, reconstruct_fit
+
+
+class FitResult(object):
+    """Immutable result of a stateless fit.
+
+    All arrays are read-only and all dicts are read-only views, so a result can be shared freely between threads.
+
+    Attributes:
+        solver_result (ndarray): the column vector of the solved variable values returned by the solver in its raw
+            form, with the background term last.
+        background (float): the solved constant background term.
+        rates (mapping): contains 1D arrays with the solved wavelength-dependent emission rates for each basis type.
+        total_emission (ndarray): 1D array containing the solved total emission rates.
+        percent_emission (mapping): contains 1D arrays corresponding to the percent contribution of each basis type to
+            the total emission at each wavelength.
+        counts (mapping): contains 1D arrays representing the solved wavelength-dependent total counts for each basis
+            type.
+        basis_names (tuple of str): names of the basis types.
+        polarization_angles (tuple of int or float): the polarization angles of the fitted data sets.
+        fits (mapping or None): contains the reconstructed fit to the observation data of each polarization angle,
+            or None if fits were not reconstructed.
+        polarization_counts (mapping): contains the wavelength-dependent counts across all basis types of each
+            polarization angle.
+        wavelength (ndarray): the wavelengths of the solved rates.
+        wavelength_window (tuple of int or None): the ``(begin, end)`` range of fitted observation pixel columns, or
+            None if the full observation was fit.
+        status (str): the solve status (see :mod:`~kemitter.model.options`).
+    """
+    def __init__(self, solver_result, rates, counts, percent_emission, total_emission, fits, polarization_counts,
+                 basis_names, wavelength, wavelength_window, status):
+        values = {'solver_result': _frozen(solver_result),
+                  'background': solver_result[-1].item(),
+                  'rates': _frozen_dict(rates),
+                  'total_emission': _frozen(total_emission),
+                  'percent_emission': _frozen_dict(percent_emission),
+                  'counts': _frozen_dict(counts),
+                  'basis_names': tuple(basis_names),
+                  'polarization_angles': tuple(polarization_counts.keys()),
+                  'fits': None if fits is None else _frozen_dict(fits),
+                  'polarization_counts': _frozen_dict(polarization_counts),
+                  'wavelength': _frozen(wavelength),
+                  'wavelength_window': wavelength_window,
+                  'status': status}
+        self.__dict__.update(values)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('FitResult is immutable.')
+
+    def __delattr__(self, name):
+        raise AttributeError('FitResult is immutable.')
+
+    def __reduce__(self):
+        # read-only dict views cannot be pickled, so results are sent between processes as plain dicts
+        state = {name: dict(value) if isinstance(value, MappingProxyType) else value
+                 for name, value in self.__dict__.items()}
+        return _unpickled_result, (state,)
+
+
+def fit(model, bases, observations, verbose=False, wavelength_range=None, fits=True):
+    """Fits built bases to observations without modifying any of the arguments.
+
+    Unlike ``Model.run()``, no data is stored in the model and the bases are neither built nor redefined, so the
+    same bases can be used by many fits running concurrently in a thread pool. The only state a fit leaves on the
+    bases is their cache of column sums (see :func:`~kemitter.basis.basis.Basis.column_sums`), which is guarded by a
+    lock. The model only supplies its hyperparameters (``alpha``, ``order`` and ``weighted``), its solver ``options``
+    and its solver routine.
+
+    Args:
+        model (Model): the model defining the problem, e.g. ``Quadratic(alpha)``. Caching is not used.
+        bases (list of Basis): the built basis objects of several polarizations, whose observation parameters match
+            ``observations``.
+        observations (list of Observation): the observation objects of several polarizations.
+        verbose (bool): the console verbosity of the called solver (MOSEK) [default False].
+        wavelength_range (tuple of float or None): the (min, max) wavelengths to fit [default None, fit the full
+            observation].
+        fits (bool): whether to reconstruct the fit images of the result [default True].
+
+    Returns (FitResult or None):
+        The immutable fit result, or None if the solver did not return a solution.
+
+    Raises:
+        ValueError: if the bases are not built or do not match the observations.
+    """
+    return _fit(model, bases, observations, verbose, wavelength_range, fits)
+
+
+def _fit(model, bases, observations, verbose=False, wavelength_range=None, fits=True, caching=False):
+    # fits as fit() does, but lets a Quadratic model use its cached Gram matrix (only safe for private model copies,
+    # since the cache is replaced if it does not match the system)
+    bases, observations = check_data_sets(bases, observations)
+    for basis, observation in zip(bases, observations):
+        parameters = basis.basis_parameters
+        if not basis.is_built:
+            raise ValueError('Basis of polarization angle {0} must be built before fitting.'.format(basis.pol_angle))
+        if parameters.uy_count != observation.momentum_pixel_count or \
+                not np.array_equal(parameters.orig_wavelength, observation.wavelength):
+            raise ValueError('Basis of polarization angle {0} was not defined for its observation.'.format(
+                basis.pol_angle))
+
+    window = wavelength_window(observations[0].wavelength, wavelength_range)
+    pixel_count = observations[0].dispersed_pixel_count
+    t0 = time.time()
+    A, b, D = system(bases, observations, model.order, model.weighted, window)
+    if caching:
+        result, status = model._solve(A, b, D, verbose, caching)
+    else:
+        result, status = model._solve(A, b, D, verbose)
+    if result is None:
+        return None
+    rates, counts, percent_emission, total_emission, polarization_counts, x, rows = process_result(
+        bases, result[:-1], window, pixel_count)
+    fits = {basis.pol_angle: reconstruct_fit(basis, x, rows) for basis in bases} if fits else None
+    wavelength = observations[0].wavelength
+    if window is not None:
+        wavelength = wavelength[window[0]:window[1]]
+    if verbose:
+        print('Fitting DONE:\n    Elapsed time: {0:.2f} s'.format(time.time() - t0))
+    return FitResult(result, rates, counts, percent_emission, total_emission, fits, polarization_counts,
+                     bases[0].basis_names, wavelength, window, status)
+
+
+def _frozen(array):
+    array = np.array(array)
+    array.setflags(write=False)
+    return array
+
+
+def _frozen_dict(arrays):
+    return MappingProxyType({key: _frozen(value) for key, value in arrays.items()})
+
+
+def _unpickled_result(state):
+    result = object.__new__(FitResult)
+    for name, value in state.items():
+        if isinstance(value, np.ndarray):
+            value = _frozen(value)
+        elif isinstance(value, dict):
+            value = _frozen_dict(value)
+        result.__dict__[name] = value
+    return result
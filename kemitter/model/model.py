@@ -1,6 +1,13 @@
 import sys
+import copy
 from abc import ABC, abstractmethod
 import numpy as np
+import scipy.sparse as sp
+from .regularization import block_difference_matrix
+from . import decomposition
+from .options import combined_status
+from .stacked import StackedSystem
+from .diagnostics import FitDiagnostics, residual_profiles
 
 
 class Model(ABC):
@@ -16,6 +23,8 @@ class Model(ABC):
 
     Attributes:
         solver_result (ndarray): 1D array containing the solved variable values returned by the solver in its raw form.
+        solver_status (str): the status of the last solve (see :mod:`~kemitter.model.options`), e.g. ``'optimal'`` or
+            ``'time_limit'`` when the solution is the best iterate found within the time budget.
         background (float): the solved constant background term.
         rates (dict): contains 1D arrays with the solved wavelength-dependent emission rates for each basis type.
         total_emission (ndarray): 1D array containing the solved total emission rates, i.e. the sum of each
@@ -25,16 +34,20 @@ class Model(ABC):
         counts (dict): contains 1D arrays representing the solved wavelength-dependent total counts for each basis type.
         basis_names (list of str): names of the basis types, denoting the keys to access specific rates, counts,
             and percent_emission vectors.
+        wavelength_window (tuple of int or None): the ``(begin, end)`` range of observation pixel columns covered by
+            the solved rates when only a wavelength range was fit, or None if the full observation was fit.
     """
     def __init__(self):
         self.__pol_children = None  # list of PolDataSets
         self.solver_result = None
+        self.solver_status = None
         self.background = None
         self.rates = None
         self.total_emission = None
         self.percent_emission = None
         self.counts = None
         self.basis_names = None
+        self.wavelength_window = None
 
     @property
     def is_empty(self):
@@ -69,6 +82,15 @@ class Model(ABC):
         if not self.is_empty:
             return [self.data_set(angle).basis.basis_matrix for angle in self.polarization_angles]
 
+    @property
+    def wavelength(self):
+        """ndarray: the wavelengths of the solved rates, i.e. those of the fitted observation pixel columns."""
+        if not self.is_empty:
+            wavelength = self.observations[0].wavelength
+            if self.wavelength_window is not None:
+                wavelength = wavelength[self.wavelength_window[0]:self.wavelength_window[1]]
+            return wavelength
+
     @property
     def n_polarizations(self):
         """int: the number of polarized data sets contained in the model."""
@@ -133,12 +155,15 @@ class Model(ABC):
             bases (list of Basis): The basis objects (built or not), to be used for fitting.
             observations (list of Observations): The observation objects to be used for fitting.
         """
-        self._load_into_pol_data_sets(bases, observations)
+        self._load(bases, observations)
+        print('\n============ Starting the kemitter ' + self.name + ' solver ============')
 
-        for b in bases:
+    def _load(self, bases, observations):
+        # loads bases and observations into polarized data sets and builds the bases, without starting a solve
+        self._load_into_pol_data_sets(bases, observations)
+        for b in self.bases:
             if not b.is_built:
                 b.build()
-        print('\n============ Starting the kemitter ' + self.name + ' solver ============')
 
     def build_bases(self):
         for angle in self.polarization_angles:
@@ -146,71 +171,185 @@ class Model(ABC):
             if not active_basis.is_built:
                 active_basis.build()
 
+    def diagnostics(self):
+        """Computes goodness-of-fit diagnostics of the solved model.
+
+        Residuals are evaluated in a single fused pass over each basis matrix, one observation pixel column at a time,
+        so no fit images are reconstructed. Per-basis-type contributions are computed from column sums of the bases.
+        When only a wavelength range was fit, diagnostics cover that range only.
+
+        Returns (FitDiagnostics):
+            The total and per-polarization residual norms, per-wavelength residual profiles, (reduced) chi-square and
+            per-basis-type contributions of the fit.
+
+        Raises:
+            RuntimeError: if the model has not been solved.
+        """
+        if self.solver_result is None:
+            raise RuntimeError('Model must be solved before computing diagnostics.')
+        basis = self.bases[0]
+        parameters = basis.basis_parameters
+        w_count = parameters.wavelength_count
+        block_count = len(self.basis_names)
+        if self.wavelength_window is None:
+            window = (0, self.observations[0].dispersed_pixel_count)
+            rows = slice(None)
+            x = self.solver_result[:-1, 0]
+        else:
+            window = self.wavelength_window
+            rows, columns = basis.window_indices(*window)
+            x = np.zeros(block_count * w_count)
+            x[columns] = self.solver_result[:-1, 0]
+        centers = basis.column_pixels()
+        kept = np.flatnonzero((centers >= window[0]) & (centers < window[1]))
+        shift = basis._row_offset() // parameters.uy_count
+
+        profiles = {}
+        chi_square_profiles = {}
+        contributions = {}
+        for angle in self.polarization_angles:
+            data_set = self.data_set(angle)
+            basis_matrix = data_set.basis.basis_matrix
+            profiles[angle], chi_square_profiles[angle] = residual_profiles(
+                basis_matrix, x, self.background.item(), data_set.observation.image,
+                w_count, parameters.ux_count, shift, window[0], window[1])
+            column_sums = data_set.basis.column_sums(rows.start, rows.stop)
+            contributions[angle] = {}
+            for i, name in enumerate(self.basis_names):
+                block = i * w_count + kept
+                contributions[angle][name] = column_sums[block] * x[block]
+        n_samples = sum((window[1] - window[0]) * observation.momentum_pixel_count
+                        for observation in self.observations)
+        return FitDiagnostics(profiles, chi_square_profiles, n_samples, len(self.solver_result), contributions)
+
     def visualize(self):
         pass
 
     def _load_into_pol_data_sets(self, bases, observations):
-        # check to ensure the same number of bases and observations have been provided.
-        if not isinstance(bases, list):
-            bases = [bases]
-        if not isinstance(observations, list):
-            observations = [observations]
-        if len(bases) != len(observations):
-            raise ValueError('Number of bases and observations do not match')
-
-        # extract the polarization angles from the bases and ensure their order and values match in the observations
-        pol_angles = []
-        for i in range(len(bases)):
-            pol_angles.append(bases[i].pol_angle)
-
-        for i in range(len(pol_angles)):
-            if observations[i].pol_angle != pol_angles[i]:
-                raise ValueError('Polarization angles in basis and observation do not match in position {0}.'.format(i))
-
-        # check that bases are of the same type
-        for i in range(len(pol_angles) - 1):
-            if bases[i].basis_names != bases[i+1].basis_names:
-                raise ValueError('Basis names ' + str(bases[i].basis_names) + ' and ' + str(bases[i+1].basis_names) +
-                                 ' do not match.')
+        bases, observations = check_data_sets(bases, observations)
         self.basis_names = bases[0].basis_names
 
         # load information into polarized data sets (PolDataSet objects), and add to list of children data sets.
         # At this step, also define the observation specific parameters for
         # the basis (wavelength and momentum grid size information)
         self.__pol_children = []
-        for i in range(len(pol_angles)):
-            self.__pol_children.append(PolDataSet(pol_angles[i], observations[i], bases[i]))
+        for i in range(len(bases)):
+            self.__pol_children.append(PolDataSet(bases[i].pol_angle, observations[i], bases[i]))
             bases[i].define_observation_parameters(observations[i].wavelength, observations[i].momentum_pixel_count)
 
-    def _process_result(self, result_val):
-        w_count = self.bases[0].basis_parameters.wavelength_count
-        orig_w_count = self.bases[0].basis_parameters.orig_wavelength_count
-        ux_count = self.bases[0].basis_parameters.ux_count
-        # find proper x_indices accounting for padded wavelength
-        self.rates = {}
-        self.counts = {}
-        self.percent_emission = {}
-        self.total_emission = np.zeros((orig_w_count, 1))
-        for i, name in enumerate(self.basis_names):
-            begin_ind = i * w_count
-            end_ind = begin_ind + w_count - 1
-            if w_count != orig_w_count:
-                begin_ind += int(np.floor((ux_count - 1) / 2))
-                end_ind -= int(np.floor(ux_count / 2))
-            self.rates[name] = result_val[begin_ind:(end_ind+1)]
-            self.total_emission += self.rates[name]
-            self.counts[name] = np.zeros_like(self.rates[name])
-            for i in range(len(self.bases)):
-                self.counts[name] += np.array(self.bases[i].basis_matrix[:,begin_ind:end_ind+1].multiply(self.rates[name].T).sum(axis=0)).T
-
-        for name in self.basis_names:
-            self.percent_emission[name] = self.rates[name] / self.total_emission
+    def _smoothness_operator(self, order=1, weighted=False, columns=None):
+        return smoothness_operator(self.bases[0], order, weighted, columns)
+
+    def _system(self, window=None):
+        return system(self.bases, self.observations, self.order, self.weighted, window, self._structured())
+
+    def _stacked_system(self, pixels=None, columns=None):
+        return stacked_system(self.bases, self.observations, pixels, columns, self._structured())
+
+    def _structured(self):
+        # whether full systems use the matrix-free views of the bases, as set in the solver options
+        options = getattr(self, 'options', None)
+        return options is not None and options.structured
+
+    def _wavelength_window(self, wavelength_range):
+        return wavelength_window(self.observations[0].wavelength, wavelength_range)
+
+    def _solver_copy(self):
+        # a copy of the model that carries its hyperparameters but no data, cheap to send to worker processes
+        clone = copy.copy(self)
+        Model.__init__(clone)
+        return clone
+
+    def _solve_decomposed(self, windows, overlap=None, processes=None, iterations=0, verbose=False):
+        """Solves the model by splitting the wavelength axis into overlapping windows.
+
+        Each window is fit independently (and in parallel processes) using the model's own ``_solve()`` routine,
+        using only the observation pixel columns inside the window and the basis functions that overlap them. Window
+        results are stitched by blending the rates across the overlaps, and the background terms are averaged.
+
+        Optionally, a number of restricted additive Schwarz iterations can then be performed. In each iteration,
+        every window is re-fit against all pixel columns touched by its basis functions, after subtracting the
+        contribution of the basis functions outside the window as given by the current stitched solution. This brings
+        the stitched result closer to the monolithic solution.
+
+        Args:
+            windows (int): the number of wavelength windows.
+            overlap (int or None): the number of pixel columns each window extends past its core on either side
+                [default None, the momentum grid size ``ux_count``].
+            processes (int or None): the number of worker processes [default None, one per core].
+            iterations (int): the number of Schwarz refinement iterations [default 0].
+            verbose (bool): the console verbosity of the called solver [default False].
+
+        Returns (tuple of (ndarray or None, str)):
+            The stitched solution vector (rates of every basis type, then background), or None if any window failed,
+            and the combined solve status of the windows.
+        """
+        bases = self.bases
+        parameters = bases[0].basis_parameters
+        pixel_count = self.observations[0].dispersed_pixel_count
+        w_count = parameters.wavelength_count
+        block_count = len(self.basis_names)
+        if overlap is None:
+            overlap = parameters.ux_count
+        ranges = decomposition.window_ranges(pixel_count, windows, overlap)
+        centers = np.tile(bases[0].column_pixels(), block_count)
+        solver = self._solver_copy()
+
+        result = None
+        extended_systems = []  # the (A, b, A_extended, D) of every extended window, reused by every Schwarz iteration
+        for iteration in range(iterations + 1):
+            print('    Solving {0} wavelength windows (pass {1} of {2})'.format(len(ranges), iteration + 1,
+                                                                              iterations + 1))
+            systems = []
+            window_columns = []
+            for i, window in enumerate(ranges):
+                _, cols = bases[0].window_indices(*window[:2])
+                if result is None:
+                    A, b, D = self._system(window[:2])
+                else:
+                    if len(extended_systems) == i:
+                        # extend the window to every pixel column touched by its basis functions
+                        first_pixels = cols % w_count - bases[0]._row_offset() // parameters.uy_count
+                        extended = (max(0, int(first_pixels.min())),
+                                    min(pixel_count, int(first_pixels.max()) + parameters.ux_count))
+                        A, b = self._stacked_system(extended, cols)
+                        A_extended, _ = self._stacked_system(extended)
+                        D = self._smoothness_operator(self.order, self.weighted, cols[:len(cols) // block_count])
+                        extended_systems.append((A, b, A_extended, D))
+                    # move the contribution of the basis functions outside of the window to the observation side
+                    A, b, A_extended, D = extended_systems[i]
+                    outside = result[:-1].copy()
+                    outside[cols] = 0
+                    b = b - A_extended @ np.vstack((outside, [[0.0]]))
+                systems.append((A, b, D))
+                window_columns.append(cols)
+
+            solutions, statuses = zip(*decomposition.solve_windows(solver, systems, processes, verbose))
+            status = combined_status(statuses)
+            if any(solution is None for solution in solutions):
+                return None, status
+
+            stitched = np.zeros((block_count * w_count + 1, 1))
+            total_weight = np.zeros((block_count * w_count, 1))
+            for window, cols, solution in zip(ranges, window_columns, solutions):
+                weight = decomposition.blend_weights(centers[cols], window, pixel_count).reshape((-1, 1))
+                stitched[cols] += weight * solution[:-1]
+                total_weight[cols] += weight
+                stitched[-1] += (window[3] - window[2]) / pixel_count * solution[-1]
+            stitched[:-1] /= np.maximum(total_weight, np.finfo(float).tiny)
+            result = stitched
+        return result, status
+
+    def _result_layout(self):
+        return result_layout(self.bases[0], self.wavelength_window, self.observations[0].dispersed_pixel_count)
 
+    def _process_result(self, result_val):
+        (self.rates, self.counts, self.percent_emission, self.total_emission,
+         polarization_counts, x, rows) = process_result(self.bases, result_val, self.wavelength_window,
+                                                        self.observations[0].dispersed_pixel_count)
         for angle in self.polarization_angles:
-            self.data_set(angle).fit = self.data_set(angle).basis.basis_matrix @ result_val
-            self.data_set(angle).counts = np.zeros((orig_w_count,1))
-            for name in self.basis_names:
-                self.data_set(angle).counts += self.counts[name]
+            self.data_set(angle).set_solution(x, rows)
+            self.data_set(angle).counts = polarization_counts[angle]
 
 
 class PolDataSet(object):
@@ -225,12 +364,291 @@ class PolDataSet(object):
         pol_angle (int or float): the polarization angle shared by all of the various data set components.
         observation (Observation): the experimental observation object
         basis (Basis): the theoretically basis object
-        fit (ndarray): reconstructed fit to observation data once solved by the model solver
         counts (ndarray): the wavelength-dependent counts at this particular polarization angle, across all basis types.
     """
     def __init__(self, pol_angle, obs, basis):
         self.pol_angle = pol_angle
         self.observation = obs
         self.basis = basis
-        self.fit = None
         self.counts = None
+        self._solution = None  # (solution over every basis column, fitted basis rows) for reconstructing the fit
+        self._fit = None
+
+    @property
+    def fit(self):
+        """ndarray: reconstructed fit to observation data once solved by the model solver. The fit is only
+        reconstructed when first accessed."""
+        if self._fit is None and self._solution is not None:
+            self._fit = self.reconstruct()
+        return self._fit
+
+    @fit.setter
+    def fit(self, value):
+        self._fit = value
+
+    def set_solution(self, x, rows=slice(None)):
+        """Stores a solution from which the fit is reconstructed on demand, discarding any previous fit.
+
+        Args:
+            x (ndarray): 1D array of the solved rates of every basis column, without the background term.
+            rows (slice): the basis rows covered by the fit [default all rows].
+        """
+        self._solution = (x, rows)
+        self._fit = None
+
+    def reconstruct(self, pixels=None, dtype=np.float64):
+        """Reconstructs the fit to the observation data, optionally cropped and in reduced precision.
+
+        Args:
+            pixels (tuple of int or None): the ``(begin, end)`` range of observation pixel columns to reconstruct
+                [default None, every fitted pixel column].
+            dtype (dtype): the data type of the returned fit, e.g. ``np.float32`` [default float64].
+
+        Returns (ndarray or None):
+            The vectorized fit as a column vector, or None if the data set has not been solved.
+        """
+        if self._solution is None:
+            return None
+        x, rows = self._solution
+        return reconstruct_fit(self.basis, x, rows, pixels, dtype)
+
+
+def check_data_sets(bases, observations):
+    """Checks that bases and observations form matching polarized data sets.
+
+    Args:
+        bases (Basis or list of Basis): the basis objects of several polarizations.
+        observations (Observation or list of Observation): the observation objects of several polarizations.
+
+    Returns (tuple of (list of Basis, list of Observation)):
+        The bases and observations as lists.
+
+    Raises:
+        ValueError: if the numbers of bases and observations, their polarization angles or the basis names do not
+            match.
+    """
+    # check to ensure the same number of bases and observations have been provided.
+    if not isinstance(bases, list):
+        bases = [bases]
+    if not isinstance(observations, list):
+        observations = [observations]
+    if len(bases) != len(observations):
+        raise ValueError('Number of bases and observations do not match')
+
+    # ensure the order and values of the polarization angles of the bases match in the observations
+    for i in range(len(bases)):
+        if observations[i].pol_angle != bases[i].pol_angle:
+            raise ValueError('Polarization angles in basis and observation do not match in position {0}.'.format(i))
+
+    # check that bases are of the same type
+    for i in range(len(bases) - 1):
+        if bases[i].basis_names != bases[i+1].basis_names:
+            raise ValueError('Basis names ' + str(bases[i].basis_names) + ' and ' + str(bases[i+1].basis_names) +
+                             ' do not match.')
+    return bases, observations
+
+
+def smoothness_operator(basis, order=1, weighted=False, columns=None):
+    """Builds the smoothness operator of the stacked system of a basis.
+
+    Differences are taken within each basis type only, leaving the trailing background column unregularized.
+
+    Args:
+        basis (Basis): a basis whose observation parameters have been defined.
+        order (int): the order of the finite difference [default 1].
+        weighted (bool): whether differences are scaled by the local wavelength spacing [default False].
+        columns (ndarray or None): the columns of a single basis type to regularize [default None, all columns].
+
+    Returns (csr_matrix):
+        The block-diagonal difference operator, with one column per column of the stacked system.
+    """
+    wavelength = basis.basis_parameters.wavelength if columns is None else basis.basis_parameters.wavelength[columns]
+    spacing = np.diff(wavelength) if weighted else None
+    return block_difference_matrix(len(basis.basis_names), len(wavelength),
+                                   order=order, spacing=spacing, extra_columns=1)
+
+
+def system(bases, observations, order=1, weighted=False, window=None, structured=False):
+    """Assembles the stacked system and smoothness operator of several polarized data sets.
+
+    Args:
+        bases (list of Basis): the built bases of several polarizations.
+        observations (list of Observation): the matching observations.
+        order (int): the order of the finite difference of the smoothness operator [default 1].
+        weighted (bool): whether differences are scaled by the local wavelength spacing [default False].
+        window (tuple of int or None): the ``(begin, end)`` range of observation pixel columns to fit
+            [default None, the full observation].
+        structured (bool): whether a full system uses the matrix-free views of the bases (see
+            ``stacked_system()``) [default False].
+
+    Returns (tuple of (StackedSystem, ndarray, csr_matrix)):
+        The stacked basis matrix (background last), the observation vector and the smoothness operator.
+    """
+    if window is None:
+        A, b = stacked_system(bases, observations, structured=structured)
+        D = smoothness_operator(bases[0], order, weighted)
+    else:
+        _, columns = bases[0].window_indices(*window)
+        A, b = stacked_system(bases, observations, window, columns)
+        D = smoothness_operator(bases[0], order, weighted, columns[:len(columns) // len(bases[0].basis_names)])
+    return A, b, D
+
+
+def stacked_system(bases, observations, pixels=None, columns=None, structured=False):
+    """Stacks the basis matrices of several polarizations and vectorizes the matching observations.
+
+    The basis matrices are referenced in place (see :class:`~kemitter.model.stacked.StackedSystem`). Only restricting
+    the system to a range of pixel columns or to a subset of basis columns copies the (smaller) selected blocks.
+
+    A full ``structured`` system evaluates its products and Gram matrix with the matrix-free views of the bases (see
+    :func:`~kemitter.basis.basis.Basis.as_operator`), which are built for the system and released with it. Model runs
+    use them when enabled in their solver options; stateless fits do not, so that shared and memory-mapped bases are
+    never copied.
+
+    Args:
+        bases (list of Basis): the built bases of several polarizations.
+        observations (list of Observation): the matching observations.
+        pixels (tuple of int or None): the ``(begin, end)`` range of observation pixel columns to keep
+            [default None, all pixel columns].
+        columns (ndarray or None): the basis columns to keep [default None, all columns].
+        structured (bool): whether a full system uses the matrix-free views of the bases [default False].
+
+    Returns (tuple of (StackedSystem, ndarray)):
+        The stacked basis matrix with the constant background column appended, and the observation column vector.
+        The observations are converted to `float`, calibrated and written directly into the preallocated observation
+        vector, in the row order of the bases (see ``Observation.fill_vector()``).
+
+    Raises:
+        ValueError: if the size of an observation does not match the rows of its basis.
+    """
+    matrices = []
+    for basis, observation in zip(bases, observations):
+        basis_matrix = basis.basis_matrix
+        data = observation.data
+        if pixels is not None:
+            uy_count = basis.basis_parameters.uy_count
+            basis_matrix = basis_matrix[pixels[0] * uy_count:pixels[1] * uy_count, :]
+            data = data[:, pixels[0]:pixels[1]]
+        if columns is not None:
+            basis_matrix = sp.csc_matrix(basis_matrix)[:, columns]
+        if data.size != basis_matrix.shape[0]:
+            raise ValueError('Observation of polarization angle {0} has {1} pixels, but its basis has {2} rows.'.format(
+                basis.pol_angle, data.size, basis_matrix.shape[0]))
+        matrices.append(basis_matrix)
+    operators = None
+    if structured and pixels is None and columns is None:
+        operators = [basis.as_operator() for basis in bases]
+    A = StackedSystem(matrices, operators)
+    b = np.empty((A.shape[0], 1))
+    for segment, observation in zip(A.split(b), observations):
+        # raw observation images are converted to float and calibrated while they are copied
+        observation.fill_vector(segment[:, 0], pixels)
+    return A, b
+
+
+def wavelength_window(wavelength, wavelength_range):
+    """Converts a wavelength range to the range of observation pixel columns it spans.
+
+    Args:
+        wavelength (ndarray): 1D array of the wavelength mapping of the observation.
+        wavelength_range (tuple of float or None): the (min, max) wavelengths.
+
+    Returns (tuple of int or None):
+        The ``(begin, end)`` range of pixel columns, or None if no range was given.
+    """
+    if wavelength_range is None:
+        return None
+    inside = np.flatnonzero((wavelength >= min(wavelength_range)) & (wavelength <= max(wavelength_range)))
+    if not inside.size:
+        raise ValueError('Wavelength range {0} does not overlap the observation.'.format(wavelength_range))
+    return int(inside[0]), int(inside[-1]) + 1
+
+
+def result_layout(basis, window, pixel_count):
+    """Locates the solved columns of a (possibly windowed) fit within a basis.
+
+    Args:
+        basis (Basis): the built basis of any of the fitted polarizations.
+        window (tuple of int or None): the ``(begin, end)`` range of fitted pixel columns, or None for a full fit.
+        pixel_count (int): the number of pixel columns of the observation.
+
+    Returns (tuple of (slice, ndarray, int, ndarray)):
+        The rows and columns of the basis matrices entering the solved system, the number of solved columns per
+        basis type, and the within-block positions of the columns whose rates are reported.
+    """
+    w_count = basis.basis_parameters.wavelength_count
+    block_count = len(basis.basis_names)
+    if window is None:
+        rows = slice(None)
+        columns = np.arange(block_count * w_count)
+        window = (0, pixel_count)
+    else:
+        rows, columns = basis.window_indices(*window)
+    # keep the rates of the columns centered within the window, dropping padded and bleeding edge columns
+    block_width = len(columns) // block_count
+    centers = basis.column_pixels()[columns[:block_width]]
+    kept = np.flatnonzero((centers >= window[0]) & (centers < window[1]))
+    return rows, columns, block_width, kept
+
+
+def process_result(bases, result_val, window, pixel_count):
+    """Splits a solution into the rates and counts of every basis type and polarization.
+
+    Fit images are not reconstructed. Instead, the solution is returned padded to every column of the bases, so that
+    the fit of any polarization can be reconstructed on demand with :func:`reconstruct_fit`.
+
+    Args:
+        bases (list of Basis): the built bases of the fitted polarizations.
+        result_val (ndarray): the solved rates as a column vector, without the background term.
+        window (tuple of int or None): the ``(begin, end)`` range of fitted pixel columns, or None for a full fit.
+        pixel_count (int): the number of pixel columns of the observations.
+
+    Returns (tuple):
+        The ``rates``, ``counts`` and ``percent_emission`` dicts keyed by basis name, the ``total_emission`` array,
+        the ``counts`` of each polarization as a dict keyed by polarization angle, the 1D solution over every basis
+        column (zero outside of the window) and the slice of basis rows covered by the window.
+    """
+    basis_names = bases[0].basis_names
+    rows, columns, block_width, kept = result_layout(bases[0], window, pixel_count)
+    block_count = len(basis_names)
+    # reported entries of every basis type, as (basis type, wavelength) arrays
+    reported = np.arange(block_count)[:, None] * block_width + kept[None, :]
+    solved = np.ravel(result_val)
+    rate_array = solved[reported]
+    total_emission = rate_array.sum(axis=0).reshape((-1, 1))
+
+    polarization_counts = {}
+    count_array = np.zeros_like(rate_array)
+    x = np.zeros(bases[0].basis_matrix.shape[1])
+    x[columns] = solved
+    for basis in bases:
+        pol_count_array = basis.column_sums(rows.start, rows.stop)[columns][reported] * rate_array
+        count_array += pol_count_array
+        polarization_counts[basis.pol_angle] = pol_count_array.sum(axis=0).reshape((-1, 1))
+
+    rates = {name: result_val[reported[i]] for i, name in enumerate(basis_names)}
+    counts = {name: count_array[i].reshape((-1, 1)) for i, name in enumerate(basis_names)}
+    percent_emission = {name: rates[name] / total_emission for name in basis_names}
+    return rates, counts, percent_emission, total_emission, polarization_counts, x, rows
+
+
+def reconstruct_fit(basis, x, rows=slice(None), pixels=None, dtype=np.float64):
+    """Reconstructs the fit image of one polarization from a solution over every basis column.
+
+    Args:
+        basis (Basis): the built basis of the polarization.
+        x (ndarray): 1D array of the solved rates of every basis column, without the background term.
+        rows (slice): the basis rows covered by the fit [default all rows].
+        pixels (tuple of int or None): the ``(begin, end)`` range of observation pixel columns to reconstruct. Only
+            the basis functions overlapping the range are evaluated [default None, the rows of the fit].
+        dtype (dtype): the data type of the returned fit [default float64].
+
+    Returns (ndarray):
+        The vectorized (column-major) fit image as a column vector.
+    """
+    if pixels is None:
+        fit = (basis.basis_matrix @ x)[rows]
+    else:
+        rows, columns = basis.window_indices(*pixels)
+        fit = (sp.csc_matrix(basis.basis_matrix)[:, columns] @ x[columns])[rows]
+    return fit.astype(dtype, copy=False).reshape((-1, 1))
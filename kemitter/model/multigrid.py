@@ -0,0 +1,74 @@
+import numpy as np
+
+
+def level_factors(levels):
+    """Validates and orders the binning factors of a multilevel fit.
+
+    Args:
+        levels (int or tuple of int): the binning factor of each coarse level, e.g. ``(4, 2)``. A single integer
+            denotes one coarse level.
+
+    Returns (list of int):
+        The distinct factors larger than 1, from the coarsest level to the finest.
+    """
+    if np.isscalar(levels):
+        levels = (levels,)
+    factors = sorted({int(factor) for factor in levels}, reverse=True)
+    if not factors or factors[-1] < 1:
+        raise ValueError('Binning factors must be positive integers, not {0}.'.format(levels))
+    return [factor for factor in factors if factor > 1]
+
+
+def coarse_data_sets(bases, observations, factor):
+    """Bins the observations of several polarizations and defines matching (unbuilt) coarse bases.
+
+    Args:
+        bases (list of Basis): the full resolution bases.
+        observations (list of Observation): the full resolution observations.
+        factor (int): the number of pixels binned together in the momentum and wavelength dimensions.
+
+    Returns (tuple of (list of Basis, list of Observation)):
+        The coarse bases and binned observations, in the order of the inputs.
+    """
+    coarse_observations = [observation.binned(factor) for observation in observations]
+    coarse_bases = [basis.observation_copy(observation.wavelength, observation.momentum_pixel_count)
+                    for basis, observation in zip(bases, coarse_observations)]
+    return coarse_bases, coarse_observations
+
+
+def prolongate(rates, coarse_wavelength, fine_wavelength, block_count):
+    """Interpolates the rates of every basis type from a coarse wavelength grid onto a fine one.
+
+    Args:
+        rates (ndarray): 1D array of coarse rates, one block of ``len(coarse_wavelength)`` columns per basis type.
+        coarse_wavelength (ndarray): 1D array of the wavelengths of the coarse basis columns.
+        fine_wavelength (ndarray): 1D array of the wavelengths of the fine basis columns.
+        block_count (int): the number of basis types.
+
+    Returns (ndarray):
+        1D array of fine rates, one block of ``len(fine_wavelength)`` columns per basis type. Rates beyond the ends of
+        the coarse grid are held constant.
+    """
+    order = np.argsort(coarse_wavelength)
+    blocks = np.reshape(rates, (block_count, len(coarse_wavelength)))
+    return np.concatenate([np.interp(fine_wavelength, coarse_wavelength[order], block[order]) for block in blocks])
+
+
+def rescale(A, b, rates, background):
+    """Scales prolongated rates to best match the fine observation, given a background estimate.
+
+    Binning changes the intensity of both the observation pixels and the basis functions, so prolongated rates are
+    only correct up to a global factor. The factor minimizing ``||s*A*x + eta - b||`` is found from a single product.
+
+    Args:
+        A (StackedSystem): the fine stacked basis matrix, including the background column.
+        b (ndarray): the fine observation vector.
+        rates (ndarray): 1D array of the prolongated rates, one per basis column of ``A``.
+        background (float): the background estimate of the fine observation.
+
+    Returns (ndarray):
+        The non-negative warm start (rates and background last) as a column vector.
+    """
+    y = A @ np.append(rates, 0.0)
+    scale = max(np.dot(y, np.ravel(b) - background), 0.0) / max(np.dot(y, y), np.finfo(float).tiny)
+    return np.append(scale * rates, max(background, 0.0)).reshape((-1, 1))
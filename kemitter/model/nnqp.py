@@ -0,0 +1,101 @@
+import time
+import numpy as np
+import scipy.sparse as sp
+from numba import jit
+from .options import OPTIMAL, TIME_LIMIT, ITERATION_LIMIT, STOPPED
+
+
+def solve_nnqp(P, q, x0=None, max_iter=10000, tol=1e-8, time_limit=None, callback=None):
+    """Solves the non-negative quadratic program (x^T*P*x - 2*q^T*x) by projected coordinate descent.
+
+    This native solver works directly on a (cached) Gram matrix and can be warm-started from a nearby solution, which
+    makes it well suited for repeated solves that share ``P`` and differ only in ``q``, such as resampled observations.
+    Since ``P`` is banded for emission bases, it is stored in CSR form and each coordinate update only touches the
+    nonzeros of one row.
+
+    Every iterate is feasible, so the solve can be stopped at any sweep by a time limit or a callback and still
+    return a valid (if not optimal) solution.
+
+    Args:
+        P (ndarray or spmatrix): the symmetric positive semi-definite 2D Gram matrix.
+        q (ndarray): the (A^T*b) vector.
+        x0 (ndarray or None): the starting point [default None, all zeros].
+        max_iter (int): the maximum number of sweeps over all coordinates [default 10000].
+        tol (float): the stopping tolerance on the largest projected gradient (KKT residual), relative to the largest
+            entry of ``q`` [default 1e-8].
+        time_limit (float or None): the wall-clock budget of the solve, in seconds [default None].
+        callback (callable or None): called as ``callback(sweep, objective, residual)`` after every sweep, where
+            ``objective`` is (x^T*P*x - 2*q^T*x). Returning True stops the solve [default None].
+
+    Returns (tuple of (ndarray, int, float, str)):
+        The solution as a column vector, the number of sweeps performed, the final relative KKT residual and the
+        solve status (see :mod:`~kemitter.model.options`).
+    """
+    t0 = time.time()
+    P = sp.csr_matrix(P)
+    data = P.data.astype(np.float64)
+    q = np.ascontiguousarray(np.ravel(q), dtype=np.float64)
+    x = np.zeros_like(q) if x0 is None else np.maximum(np.array(np.ravel(x0), dtype=np.float64), 0.0)
+    diagonal, g = _gradient(P.indptr, P.indices, data, q, x)
+    scale = max(np.abs(q).max(), 1e-300)
+
+    # without monitoring, all sweeps run in a single native call
+    monitored = time_limit is not None or callback is not None
+    sweeps_per_call = 1 if monitored else max_iter
+    sweeps = 0
+    residual = np.inf
+    status = ITERATION_LIMIT
+    while sweeps < max_iter:
+        done, residual = _sweeps(P.indptr, P.indices, data, diagonal, g, x, min(sweeps_per_call, max_iter - sweeps),
+                                 tol * scale)
+        sweeps += done
+        residual /= scale
+        if residual <= tol:
+            status = OPTIMAL
+        elif callback is not None and callback(sweeps, np.dot(x, g) - np.dot(q, x), residual):
+            status = STOPPED
+        elif time_limit is not None and time.time() - t0 >= time_limit:
+            status = TIME_LIMIT
+        else:
+            continue
+        break
+    return x.reshape((-1, 1)), sweeps, residual, status
+
+
+@jit(nopython=True)
+def _gradient(indptr, indices, data, q, x):
+    # diagonal of P and gradient (P*x - q) at x
+    n = len(q)
+    diagonal = np.zeros(n)
+    g = -q.copy()
+    for i in range(n):
+        for k in range(indptr[i], indptr[i + 1]):
+            g[i] += data[k] * x[indices[k]]
+            if indices[k] == i:
+                diagonal[i] = data[k]
+    return diagonal, g
+
+
+@jit(nopython=True)
+def _sweeps(indptr, indices, data, diagonal, g, x, max_sweeps, tol):
+    # performs up to max_sweeps coordinate sweeps in place, stopping once the absolute KKT residual reaches tol
+    n = len(x)
+    residual = np.inf
+    for sweep in range(max_sweeps):
+        for i in range(n):
+            if diagonal[i] <= 0.0:
+                continue
+            updated = max(0.0, x[i] - g[i] / diagonal[i])
+            delta = updated - x[i]
+            if delta != 0.0:
+                x[i] = updated
+                # P is symmetric, so row i holds column i
+                for k in range(indptr[i], indptr[i + 1]):
+                    g[indices[k]] += data[k] * delta
+        residual = 0.0
+        for i in range(n):
+            projected = g[i] if x[i] > 0.0 else min(g[i], 0.0)
+            residual = max(residual, abs(projected))
+        if residual <= tol:
+            return sweep + 1, residual
+    return max_sweeps, residual
@@ -0,0 +1,117 @@
+import time
+import cvxpy as cvx
+
+OPTIMAL = 'optimal'
+INACCURATE = 'optimal_inaccurate'
+TIME_LIMIT = 'time_limit'
+ITERATION_LIMIT = 'iteration_limit'
+STOPPED = 'stopped'
+FAILED = 'failed'
+
+
+class SolverOptions(object):
+    """Limits and monitoring options passed to the solver of a model.
+
+    Every option applies to each individual solver call, i.e. to each window of a decomposed fit and to each level of a
+    multilevel fit. When a limit is reached, the best iterate found so far is returned together with a status flag
+    (one of the module constants ``OPTIMAL``, ``INACCURATE``, ``TIME_LIMIT``, ``ITERATION_LIMIT``, ``STOPPED`` or
+    ``FAILED``).
+
+    MOSEK is an interior-point solver whose intermediate iterates are not feasible, so it can only return a solution
+    when it stops close enough to optimality. Use ``native=True`` with the ``Quadratic`` model for hard time budgets:
+    the native solver keeps a feasible iterate at all times.
+
+    Attributes:
+        time_limit (float or None): the wall-clock budget of a solve, in seconds.
+        tol (float or None): the relative tolerance, i.e. the relative duality gap for MOSEK and the relative KKT
+            residual for the native solver.
+        max_iter (int or None): the maximum number of interior-point iterations (MOSEK) or coordinate sweeps (native
+            solver).
+        callback (callable or None): called as ``callback(iteration, objective, residual)`` after every sweep of the
+            native solver, and once with the final values for MOSEK (where ``residual`` is None, and so is
+            ``iteration`` if the solver does not report it). Returning True stops the solve early. For decomposed fits
+            solved in worker processes, the callback must be picklable and runs in the workers.
+        native (bool): whether the ``Quadratic`` model solves its problem with the native non-negative QP solver
+            instead of MOSEK.
+        structured (bool): whether model runs evaluate the Gram matrix and the products of full (not windowed)
+            systems with the matrix-free views of the bases (see :func:`~kemitter.basis.basis.Basis.as_operator`).
+            The views are built for each system and released with it, but hold a copy of the basis patterns meanwhile.
+    """
+    def __init__(self, time_limit=None, tol=None, max_iter=None, callback=None, native=False, structured=False):
+        self.time_limit = time_limit
+        self.tol = tol
+        self.max_iter = max_iter
+        self.callback = callback
+        self.native = native
+        self.structured = structured
+
+    def mosek_params(self):
+        """dict: the MOSEK parameters implementing the limits, as passed to ``cvxpy.Problem.solve()``."""
+        params = {}
+        if self.time_limit is not None:
+            params['MSK_DPAR_OPTIMIZER_MAX_TIME'] = float(self.time_limit)
+        if self.tol is not None:
+            params['MSK_DPAR_INTPNT_CO_TOL_REL_GAP'] = float(self.tol)
+        if self.max_iter is not None:
+            params['MSK_IPAR_INTPNT_MAX_ITERATIONS'] = int(self.max_iter)
+        return params
+
+    def nnqp_params(self):
+        """dict: the keyword arguments of :func:`~kemitter.model.nnqp.solve_nnqp` implementing the limits."""
+        params = {'time_limit': self.time_limit, 'callback': self.callback}
+        if self.tol is not None:
+            params['tol'] = self.tol
+        if self.max_iter is not None:
+            params['max_iter'] = self.max_iter
+        return params
+
+
+def solve_problem(problem, x, verbose=False, options=None):
+    """Solves a cvxpy problem with MOSEK under the limits of a set of solver options.
+
+    Args:
+        problem (Problem): the cvxpy problem.
+        x (Variable): the solved variable.
+        verbose (bool): the console verbosity of the called solver (MOSEK) [default False].
+        options (SolverOptions or None): the solver limits [default None, MOSEK defaults].
+
+    Returns (tuple of (ndarray or None, str)):
+        The solution, or None if the solver did not return one, and the solve status.
+    """
+    if options is None:
+        options = SolverOptions()
+    t0 = time.time()
+    try:
+        problem.solve(solver=cvx.MOSEK, verbose=verbose, mosek_params=options.mosek_params())
+    except cvx.SolverError:
+        return None, FAILED
+    if x.value is None:
+        return None, FAILED
+    # some solvers do not report their iteration count
+    iterations = problem.solver_stats.num_iters if problem.solver_stats is not None else None
+    if problem.status == cvx.OPTIMAL:
+        status = OPTIMAL
+    elif options.time_limit is not None and time.time() - t0 >= options.time_limit:
+        status = TIME_LIMIT
+    elif options.max_iter is not None and iterations is not None and iterations >= options.max_iter:
+        status = ITERATION_LIMIT
+    else:
+        status = INACCURATE
+    if options.callback is not None:
+        options.callback(iterations, problem.value, None)
+    return x.value, status
+
+
+def combined_status(statuses):
+    """Reduces the statuses of several solves (e.g. decomposed windows) to a single status.
+
+    Args:
+        statuses (list of str): the status of every solve.
+
+    Returns (str):
+        ``OPTIMAL`` if every solve was optimal, otherwise the first other status.
+    """
+    for status in statuses:
+        if status != OPTIMAL:
+            return status
+    return OPTIMAL
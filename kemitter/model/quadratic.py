@@ -1,9 +1,11 @@
+import weakref
 import numpy as np
-import scipy.sparse as sp
 import cvxpy as cvx
-from numba import jit
 import time
 from .model import Model
+from .nnqp import solve_nnqp
+from .options import SolverOptions, solve_problem
+from . import multigrid
 
 
 class Quadratic(Model):
@@ -12,18 +14,34 @@ class Quadratic(Model):
         Attributes:
             name (str): "QUADRATIC" (constant)
             alpha (float): the regularization parameter for the smoothness penalty
-            cache (ndarray): A cached 2D (A^T*A) array from a previous calculation (used for repeated fits).
+            order (int): the order of the finite difference used in the smoothness penalty (1 or 2)
+            weighted (bool): whether differences are scaled by the local wavelength spacing
+            cache (ndarray): A cached 2D (A^T*A + alpha^2*D^T*D) array from a previous calculation (used for repeated
+                fits).
+            polarization_weights (dict): the least squares weight of each polarization angle (1 if not given), set
+                with ``set_weight()``.
+            polarization_cache (dict): the cached Gram matrix and (A^T*b) contributions of each polarization angle and
+                fitted wavelength window.
+            options (SolverOptions or None): the time budget, tolerance, iteration limit and progress callback of the
+                solver, and whether to use the native solver instead of MOSEK.
 
         See Also:
             :class:`~kemitter.model.model.Model`
         """
-    def __init__(self, alpha):
+    def __init__(self, alpha, order=1, weighted=False, options=None):
         super().__init__()
         self.cache = None
+        self.polarization_weights = {}
+        self.polarization_cache = {}
+        self._cache_terms = None  # the problem setup and (weight, Gram) contributions summed into the cache
         self.name = "QUADRATIC"
         self.alpha = alpha
+        self.order = order
+        self.weighted = weighted
+        self.options = options
 
-    def run(self, bases, observation, verbose=True, caching=False):
+    def run(self, bases, observation, verbose=True, caching=False,
+            windows=None, overlap=None, processes=None, iterations=0, wavelength_range=None, levels=None):
         """Runs the model calculations.
 
         Bases and observations are loaded into proper polarized data sets. In this step,
@@ -32,10 +50,29 @@ class Quadratic(Model):
 
         Bases and observations of multiple polarizations are then concatenated and given to cvxpy and MOSEK for solving.
 
-        The problem is first factorized into its quadratic form by performing the matrix multiplication (A^T*A).
-        This is an expensive operation that comes with the benefit of much faster solving times. For repeated fits
-        (for example, fits of multiple frames with the same bases), this resulting matrix can be cached to avoid
-        repetitive recalculations.
+        The problem is first factorized into its quadratic form by performing the sparse matrix multiplication
+        (A^T*A + alpha^2*D^T*D), where D is the banded smoothness operator. This is an expensive operation that comes
+        with the benefit of much faster solving times. For repeated fits (for example, fits of multiple frames with the
+        same bases), this resulting matrix can be cached to avoid repetitive recalculations. The Gram matrix is the sum
+        of the contributions of every polarization, which are cached separately along with their (A^T*b) products.
+        When polarizations are added, removed or reweighted (see ``set_weight()``) between cached runs, only their
+        contributions are added to or subtracted from the cached total. Weights and per-polarization caching apply to
+        monolithic solves only.
+
+        When only an emission band is of interest, ``wavelength_range`` restricts the fit to a wavelength window.
+        The corresponding rows and columns are sliced out of the already built bases and the observations are cropped
+        to match, so no basis needs to be rebuilt. Basis functions centered just outside of the window whose patterns
+        bleed into it are included in the fit, but only the rates within the window are reported.
+
+        For long spectra, the problem can instead be decomposed into ``windows`` overlapping wavelength windows that
+        are solved in parallel processes and stitched together (see ``Model._solve_decomposed()``). Caching does not
+        apply to decomposed solves.
+
+        Full resolution problems can also be solved on a hierarchy of ``levels``. The observations are binned in both
+        the momentum and wavelength dimensions by each level's factor, and a matching coarse basis is built and fit.
+        The coarse rates are interpolated onto the next finer wavelength grid and used to warm-start a native
+        non-negative QP solver (see :func:`~kemitter.model.nnqp.solve_nnqp`), which refines them at each finer level
+        and finally at full resolution. Multilevel fitting cannot be combined with decomposition.
 
         Results are returned and processed in inherited ``Model`` attributes.
 
@@ -43,65 +80,238 @@ class Quadratic(Model):
             bases (list of Basis): The basis objects (built or not) of several polarizations, to be used for fitting.
             observation (list of Observation): The observation objects of several polarizations, to be used for fitting.
             verbose (bool): The console verbosity of the called solver (MOSEK) [default True].
-            caching (bool): Whether or not to use or store the resulting basis-matrix multiplication [default False].
+            caching (bool): Whether or not to use or store the resulting basis-matrix multiplications [default False].
+            windows (int or None): The number of wavelength windows to decompose the problem into [default None,
+                solve monolithically].
+            overlap (int or None): The number of pixel columns by which neighboring windows overlap on either side
+                [default None, the momentum grid size].
+            processes (int or None): The number of worker processes used to solve the windows [default None, one
+                per core].
+            iterations (int): The number of Schwarz refinement iterations after stitching the windows [default 0].
+            wavelength_range (tuple of float or None): The (min, max) wavelengths to fit. Only the matching
+                observation pixel columns and the basis functions overlapping them are used, so the solve scales with
+                the size of the range [default None, fit the full observation].
+            levels (int or tuple of int or None): The binning factors of the coarse levels, e.g. ``(4, 2)`` fits the
+                observation binned 4 X 4, then 2 X 2, before refining at full resolution [default None, solve at full
+                resolution only].
         """
+        if windows is not None and wavelength_range is not None:
+            raise ValueError('Wavelength decomposition and wavelength range fitting cannot be combined.')
+        if windows is not None and levels is not None:
+            raise ValueError('Wavelength decomposition and multilevel fitting cannot be combined.')
         super().run(bases, observation)
+        self.wavelength_window = self._wavelength_window(wavelength_range)
 
         print('Bases and observations loaded in model')
         t0 = time.time()
         print('Forming QP problem:')
-        print('    Setting up basis and observation matrices')
-        A = sp.vstack([self.data_set(angle).basis.basis_matrix for angle in self.polarization_angles])
-
-        basis_rows = A.shape[0]
-        n = A.shape[1] + 1
-
-        o = sp.csc_matrix((np.ones(basis_rows, ), (np.arange(basis_rows), np.zeros(basis_rows, ))))
-        A = sp.hstack((A, o))
+        if windows is not None:
+            result, self.solver_status = self._solve_decomposed(windows, overlap, processes, iterations, verbose)
+        else:
+            print('    Setting up basis and observation matrices')
+            A, b, D = self._system(self.wavelength_window)
+            x0 = None
+            if levels is not None:
+                x0 = self._multigrid_start(levels, A, b, verbose)
+            native = x0 is not None or (self.options is not None and self.options.native)
+            solver = 'NNQP' if native else cvx.MOSEK
+            print('Problem Formulation DONE\n\nCalling the solver: ' + solver)
+            ts0 = time.time()
+            sources = (self.bases, self.observations, self.wavelength_window)
+            result, self.solver_status = self._solve(A, b, D, verbose, caching, x0, sources)
+            ts1 = time.time()
+            print(solver + ' done in {0:.2f} seconds (status: {1}).'.format(ts1 - ts0, self.solver_status))
+        if result is not None:
+            print('\nProcessing solution')
+            self.solver_result = result
+            self.background = self.solver_result[-1]
+            self._process_result(self.solver_result[:-1])
+            t1 = time.time()
+            print('Fitting DONE:\n    Elapsed time: {0:.2f} s'.format(t1-t0))
 
-        D = np.diag(np.ones((A.shape[1] - 1,)), k=1) - np.diag(np.ones((A.shape[1],)))
-        D = D[:-1, :]
-        alpha = self.alpha
-        A = sp.vstack((A, alpha * D))
-        H = cvx.Constant(A)
+    def set_weight(self, pol_angle, weight):
+        """Sets the least squares weight of a polarization.
 
-        b = np.vstack([self.data_set(angle).observation.data.reshape((180 * 1024, 1), order='F') for angle in
-                       self.polarization_angles])
+        With caching, a reweighted polarization only updates the cached Gram matrix by its own contribution, so a weight
+        of 0 drops a bad channel without recomputing anything.
 
-        zz = np.zeros((A.shape[1] - 1, 1))
-        b = np.vstack((b,zz))
-        b = cvx.Constant(b)
+        Args:
+            pol_angle (int or float): the polarization angle, in degrees.
+            weight (float): the non-negative weight of the polarization's residual in the objective.
+        """
+        if weight < 0:
+            raise ValueError('Polarization weights must be non-negative, not {0}.'.format(weight))
+        self.polarization_weights[pol_angle] = float(weight)
 
-        x = cvx.Variable(n)
+    def _solve(self, A, b, D, verbose, caching=False, x0=None, sources=None):
+        # solves the quadratic form of the problem for a stacked system (with the background as its last column),
+        # refining the warm start x0 with the native solver if given, and returns the solution and solve status.
+        # Only run() passes the (bases, observations, window) the system was assembled from as sources, which enables
+        # polarization weights and per-polarization caching; any other system is solved as given
+        if sources is not None:
+            P, q, bb = self._polarization_problem(A, b, D, caching, *sources)
+        else:
+            P, q, bb = self._stacked_problem(A, b, D, caching)
+        options = self.options if self.options is not None else SolverOptions()
+        if x0 is None and not options.native:
+            return solve_quadratic(P, q, bb, verbose, options)
+        x, sweeps, residual, status = solve_nnqp(P, q, x0, **options.nnqp_params())
+        print('    Refined in {0} sweeps (relative KKT residual {1:.2e})'.format(sweeps, residual))
+        return x, status
 
-        if self.cache is None or not caching:
+    def _stacked_problem(self, A, b, D, caching):
+        # the quadratic problem of a stacked system with no polarized data sets attached, e.g. in solver copies
+        q = A.H @ b
+        bb = (b.T @ b).item()
+        if self.cache is None or not caching or self.cache.shape != (A.shape[1], A.shape[1]):
             print('    Multiplying ATA')
-            P = np.array(ATA(A.todense()))
+            P = gram(A, D, self.alpha)
             if caching:
                 self.cache = P
+                self._cache_terms = None
         else:
             print('    Pulling ATA from cache')
             P = self.cache
-        print('    Defining objective')
-        objective = cvx.Minimize(cvx.quad_form(x, P) - 2*((H.T*b).T)*x + b.T*b)
-        print('    Defining constraints')
-        constraints = [x >= 0]
-        print('    Defining problem')
-        prob = cvx.Problem(objective, constraints)
-        print('Problem Formulation DONE\n\nCalling the solver: ' + cvx.MOSEK)
-        ts0 = time.time()
-        prob.solve(solver=cvx.MOSEK, verbose=verbose)
-        ts1 = time.time()
-        print(cvx.MOSEK + ' done in {0:.2f} seconds.'.format(ts1 - ts0))
-        if x.value is not None:
-            print('\nProcessing solution')
-            self.solver_result = np.array(x.value)
-            self.background = self.solver_result[-1]
-            self._process_result(self.solver_result[:-1])
-            t1 = time.time()
-            print('Fitting DONE:\n    Elapsed time: {0:.2f} s'.format(t1-t0))
+        return P, q, bb
+
+    def _polarization_problem(self, A, b, D, caching, bases, observations, window):
+        # the weighted quadratic problem of the polarized data sets the system was assembled from, summed from
+        # per-polarization contributions. With caching, contributions are kept per polarization angle and window, and
+        # the cached total is updated by the contributions that changed since it was formed
+        terms = {}
+        q = np.zeros(A.shape[1])
+        bb = 0.0
+        for i, (basis, observation, segment) in enumerate(zip(bases, observations, A.split(b))):
+            angle = basis.pol_angle
+            key = (angle, window)
+            cached = self.polarization_cache.get(key) if caching else None
+            if cached is None or cached[0]() is not basis.basis_matrix or cached[1].shape[0] != A.shape[1]:
+                cached = (weakref.ref(basis.basis_matrix), A.block_gram(i), None, None)
+            # the (A^T*b) contribution also depends on the calibration of the raw observation data. The dark and gain
+            # are compared by identity, since calibrations share cropped reference arrays between observations
+            if cached[2] is None or cached[2][0]() is not observation.data or cached[2][1] is not observation.dark \
+                    or cached[2][2] is not observation.gain:
+                source = (weakref.ref(observation.data), observation.dark, observation.gain)
+                cached = cached[:2] + (source, A.block_rmatvec(i, segment))
+            if caching:
+                self.polarization_cache[key] = cached
+            weight = self.polarization_weights.get(angle, 1.0)
+            terms[key] = (weight, cached[1])
+            q += weight * cached[3]
+            bb += weight * (segment.T @ segment).item()
+
+        setup = (window, self.alpha, self.order, self.weighted, A.shape[1])
+        if caching and self.cache is not None and self._cache_terms is not None and self._cache_terms[0] == setup:
+            print('    Updating ATA from cached polarizations')
+            P = self.cache
+            included = self._cache_terms[1]
+            for key in set(included) | set(terms):
+                old_weight, old_gram = included.get(key, (0.0, None))
+                new_weight, new_gram = terms.get(key, (0.0, None))
+                if old_gram is new_gram:
+                    _add_sparse(P, new_gram, new_weight - old_weight)
+                    continue
+                if old_gram is not None:
+                    _add_sparse(P, old_gram, -old_weight)
+                if new_gram is not None:
+                    _add_sparse(P, new_gram, new_weight)
+        else:
+            print('    Multiplying ATA')
+            P = (self.alpha ** 2 * (D.T @ D)).toarray()
+            for weight, contribution in terms.values():
+                _add_sparse(P, contribution, weight)
+        if caching:
+            self.cache = P
+            self._cache_terms = (setup, terms)
+        return P, q.reshape((-1, 1)), bb
+
+    def _multigrid_start(self, levels, A, b, verbose):
+        # solves the problem on binned copies of the data, from the coarsest level to the finest, and returns the
+        # prolongated warm start for the full resolution system (A, b) of the model, or None if a level failed
+        coarse = None
+        for factor in multigrid.level_factors(levels):
+            print('    Solving level binned {0} X {0}'.format(factor))
+            level = self._solver_copy()
+            level._load_into_pol_data_sets(*multigrid.coarse_data_sets(self.bases, self.observations, factor))
+            level.build_bases()
+            A_level, b_level, D_level = level._system()
+            x0 = None if coarse is None else self._prolongated(coarse, level, factor, A_level, b_level)
+            solution, _ = level._solve(A_level, b_level, D_level, verbose, x0=x0,
+                                       sources=(level.bases, level.observations, None))
+            if solution is None:
+                return None
+            coarse = (solution, level.bases[0].basis_parameters.wavelength, factor)
+        if coarse is None:
+            return None
+        return self._prolongated(coarse, self, 1, A, b)
+
+    def _prolongated(self, coarse, level, factor, A, b):
+        # interpolates a coarse solution onto the basis columns of a finer level (restricted to its wavelength window)
+        # and rescales it against the finer system (A, b)
+        solution, coarse_wavelength, coarse_factor = coarse
+        rates = multigrid.prolongate(solution[:-1, 0], coarse_wavelength, level.bases[0].basis_parameters.wavelength,
+                                     len(self.basis_names))
+        if level.wavelength_window is not None:
+            _, columns = level.bases[0].window_indices(*level.wavelength_window)
+            rates = rates[columns]
+        # every binned pixel sums factor^2 pixels of the finer level
+        background = solution[-1, 0] * (factor / coarse_factor) ** 2
+        return multigrid.rescale(A, b, rates, background)
+
+    def _solver_copy(self):
+        clone = super()._solver_copy()
+        clone.cache = None
+        clone.polarization_cache = {}
+        clone._cache_terms = None
+        return clone
+
+
+def _add_sparse(P, contribution, weight):
+    # adds a weighted sparse matrix to a dense one in place, touching only its nonzeros
+    if weight == 0:
+        return
+    contribution = contribution.tocoo()
+    P[contribution.row, contribution.col] += weight * contribution.data
+
+
+def gram(A, D, alpha):
+    """Forms the regularized Gram matrix (A^T*A + alpha^2*D^T*D) of the quadratic problem.
+
+    The data term is accumulated block by block from the bases of each polarization and the smoothness term is a
+    sparse product, so neither the stacked basis nor the banded smoothness operator is ever assembled or densified.
+    Only the ``n X n`` result is returned as a dense array.
+
+    Args:
+        A (StackedSystem): the stacked basis matrix, including the background column.
+        D (spmatrix): the smoothness operator, with one column per column of ``A``.
+        alpha (float): the regularization parameter for the smoothness penalty.
+
+    Returns (ndarray):
+        The dense 2D Gram matrix.
+    """
+    P = A.gram() + alpha ** 2 * (D.T @ D)
+    return P.toarray()
+
+
+def solve_quadratic(P, q, bb, verbose=False, options=None):
+    """Solves the non-negative quadratic program (x^T*P*x - 2*q^T*x + bb) with cvxpy and MOSEK.
 
+    Args:
+        P (ndarray): the dense 2D Gram matrix.
+        q (ndarray): the (A^T*b) column vector.
+        bb (float): the squared norm of the observation vector, (b^T*b).
+        verbose (bool): the console verbosity of the called solver (MOSEK) [default False].
+        options (SolverOptions or None): the limits of the solver [default None, MOSEK defaults].
 
-@jit(nopython=True, parallel=True)
-def ATA(A):
-    return A.transpose() @ A
+    Returns (tuple of (ndarray or None, str)):
+        The solution as a column vector, or None if the solver did not return a solution, and the solve status.
+    """
+    q = cvx.Constant(q)
+    x = cvx.Variable(P.shape[0])
+    objective = cvx.Minimize(cvx.quad_form(x, P) - 2*(q.T*x) + bb)
+    constraints = [x >= 0]
+    prob = cvx.Problem(objective, constraints)
+    value, status = solve_problem(prob, x, verbose, options)
+    if value is None:
+        return None, status
+    return np.array(value).reshape((-1, 1)), status
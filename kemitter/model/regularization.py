@@ -0,0 +1,67 @@
+import numpy as np
+import scipy.sparse as sp
+
+
+def difference_matrix(n, order=1, spacing=None):
+    """Builds a sparse banded finite difference operator.
+
+    Each row of the first order operator computes ``x[i+1] - x[i]``, and higher orders are formed by repeated
+    application. When ``spacing`` is given, every first difference is divided by its (mean-normalized) sample spacing
+    so that the penalty measures a derivative with respect to wavelength rather than to column index. Normalizing by the
+    mean spacing keeps the magnitude of the operator, and therefore the meaning of ``alpha``, unchanged for evenly
+    spaced samples.
+
+    Args:
+        n (int): the number of samples (columns) the operator acts on.
+        order (int): the order of the difference operator (1 or 2 are typical) [default 1].
+        spacing (ndarray or None): 1D array of ``n - 1`` sample spacings, e.g. ``np.diff(wavelength)``
+            [default None, uniform spacing].
+
+    Returns (csr_matrix):
+        The ``(n - order) X n`` difference operator, holding ``order + 1`` diagonals.
+    """
+    if order < 1:
+        raise ValueError('Difference order must be at least 1, not {0}.'.format(order))
+    if n <= order:
+        raise ValueError('Cannot form an order {0} difference over {1} samples.'.format(order, n))
+
+    if spacing is not None:
+        spacing = np.abs(np.asarray(spacing, dtype=float))
+        if spacing.shape != (n - 1,):
+            raise ValueError('Expected {0} sample spacings, got {1}.'.format(n - 1, spacing.shape))
+        spacing = spacing / spacing.mean()
+
+    operator = sp.identity(n, format='csr')
+    for k in range(order):
+        m = n - k
+        step = sp.diags([-np.ones(m - 1), np.ones(m - 1)], [0, 1], shape=(m - 1, m), format='csr')
+        if spacing is not None:
+            # average the spacings spanned by each row of the previous order to get the local step size
+            width = np.convolve(spacing, np.ones(k + 1), mode='valid') / (k + 1)
+            step = sp.diags(1 / width) @ step
+        operator = step @ operator
+    return operator.tocsr()
+
+
+def block_difference_matrix(block_count, block_size, order=1, spacing=None, extra_columns=1):
+    """Builds a block-diagonal difference operator for a concatenated set of basis rates.
+
+    Each basis type (e.g. ``ED`` and ``MD``) occupies its own contiguous block of columns in the solution vector, so
+    differences are only taken within a block. The last rate of one basis type is never coupled to the first rate of
+    the next, and trailing columns such as the constant background term are left unregularized.
+
+    Args:
+        block_count (int): the number of basis types (column blocks).
+        block_size (int): the number of columns (wavelengths) in each block.
+        order (int): the order of the difference operator [default 1].
+        spacing (ndarray or None): 1D array of ``block_size - 1`` sample spacings shared by every block [default None].
+        extra_columns (int): the number of unregularized trailing columns, e.g. 1 for the background [default 1].
+
+    Returns (csr_matrix):
+        The ``block_count * (block_size - order) X (block_count * block_size + extra_columns)`` operator.
+    """
+    block = difference_matrix(block_size, order=order, spacing=spacing)
+    operator = sp.block_diag([block] * block_count, format='csr')
+    if extra_columns:
+        operator = sp.hstack((operator, sp.csr_matrix((operator.shape[0], extra_columns))), format='csr')
+    return operator
@@ -1,8 +1,8 @@
 import numpy as np
-import scipy.sparse as sp
 import cvxpy as cvx
 import time
 from .model import Model
+from .options import solve_problem
 
 
 class Ridge(Model):
@@ -11,16 +11,24 @@ class Ridge(Model):
     Attributes:
         name (str): "RIDGE" (constant)
         alpha (float): the regularization parameter for the smoothness penalty
+        order (int): the order of the finite difference used in the smoothness penalty (1 or 2)
+        weighted (bool): whether differences are scaled by the local wavelength spacing
+        options (SolverOptions or None): the time budget, tolerance, iteration limit and progress callback of the
+            solver.
 
     See Also:
         :class:`~kemitter.model.model.Model`
     """
-    def __init__(self, alpha):
+    def __init__(self, alpha, order=1, weighted=False, options=None):
         super().__init__()
         self.alpha = alpha
+        self.order = order
+        self.weighted = weighted
+        self.options = options
         self.name = "RIDGE"
 
-    def run(self, bases, observation, verbose=True):
+    def run(self, bases, observation, verbose=True,
+            windows=None, overlap=None, processes=None, iterations=0, wavelength_range=None):
         """Runs the model calculations.
 
         Bases and observations are loaded into proper polarized data sets. In this step,
@@ -29,54 +37,70 @@ class Ridge(Model):
 
         Bases and observations of multiple polarizations are then concatenated and given to cvxpy and MOSEK for solving.
 
+        When only an emission band is of interest, ``wavelength_range`` restricts the fit to a wavelength window.
+        The corresponding rows and columns are sliced out of the already built bases and the observations are cropped
+        to match, so no basis needs to be rebuilt. Basis functions centered just outside of the window whose patterns
+        bleed into it are included in the fit, but only the rates within the window are reported.
+
+        For long spectra, the problem can instead be decomposed into ``windows`` overlapping wavelength windows that
+        are solved in parallel processes and stitched together (see ``Model._solve_decomposed()``).
+
         Results are returned and processed in inherited ``Model`` attributes.
 
         Args:
             bases (list of Basis): The basis objects (built or not) of several polarizations, to be used for fitting.
             observation (list of Observation): The observation objects of several polarizations, to be used for fitting.
             verbose (bool): The console verbosity of the called solver (MOSEK).
+            windows (int or None): The number of wavelength windows to decompose the problem into [default None,
+                solve monolithically].
+            overlap (int or None): The number of pixel columns by which neighboring windows overlap on either side
+                [default None, the momentum grid size].
+            processes (int or None): The number of worker processes used to solve the windows [default None, one
+                per core].
+            iterations (int): The number of Schwarz refinement iterations after stitching the windows [default 0].
+            wavelength_range (tuple of float or None): The (min, max) wavelengths to fit. Only the matching
+                observation pixel columns and the basis functions overlapping them are used, so the solve scales with
+                the size of the range [default None, fit the full observation].
         """
+        if windows is not None and wavelength_range is not None:
+            raise ValueError('Wavelength decomposition and wavelength range fitting cannot be combined.')
         super().run(bases, observation)
+        self.wavelength_window = self._wavelength_window(wavelength_range)
 
         print('Bases and observations loaded in model')
         t0 = time.time()
         print('Forming Regularized problem:')
-        print('    Setting up basis and observation matrices')
-        A = sp.vstack([self.data_set(angle).basis.basis_matrix for angle in self.polarization_angles])
-
-        basis_rows = A.shape[0]
-        n = A.shape[1] + 1
-
-        o = sp.csc_matrix((np.ones(basis_rows, ), (np.arange(basis_rows), np.zeros(basis_rows, ))))
-        A = sp.hstack((A, o))
-        H = cvx.Constant(A)
-
-        b = np.vstack([self.data_set(angle).observation.data.reshape((180 * 1024, 1), order='F') for angle in
-                       self.polarization_angles])
-        b = cvx.Constant(b)
-
-        x = cvx.Variable(n)
-
         print('    Defining regularization term with alpha = {0}'.format(self.alpha))
-        D = np.diag(np.ones((A.shape[1] - 1,)), k=1) - np.diag(np.ones((A.shape[1],)))
-        D = cvx.Constant(D[:-1, :])
-        alpha = self.alpha
-
-        print('    Defining objective')
-        objective = cvx.Minimize(cvx.norm2(H * x - b) + alpha * cvx.norm2(D * x))
-        print('    Defining constraints')
-        constraints = [x[:-1] >= 0]
-        print('    Defining problem')
-        prob = cvx.Problem(objective, constraints)
-        print('Problem Formulation DONE\n\nCalling the solver: ' + cvx.MOSEK)
-        ts0 = time.time()
-        prob.solve(solver=cvx.MOSEK, verbose=verbose)
-        ts1 = time.time()
-        print(cvx.MOSEK + ' done in {0:.2f} seconds.'.format(ts1 - ts0))
-        if x.value is not None:
+        if windows is not None:
+            result, self.solver_status = self._solve_decomposed(windows, overlap, processes, iterations, verbose)
+        else:
+            print('    Setting up basis and observation matrices')
+            A, b, D = self._system(self.wavelength_window)
+            print('Problem Formulation DONE\n\nCalling the solver: ' + cvx.MOSEK)
+            ts0 = time.time()
+            result, self.solver_status = self._solve(A, b, D, verbose)
+            ts1 = time.time()
+            print(cvx.MOSEK + ' done in {0:.2f} seconds (status: {1}).'.format(ts1 - ts0, self.solver_status))
+        if result is not None:
             print('\nProcessing solution')
-            self.solver_result = np.array(x.value)
+            self.solver_result = result
             self.background = self.solver_result[-1]
             self._process_result(self.solver_result[:-1])
             t1 = time.time()
             print('Fitting DONE:\n    Elapsed time: {0:.2f} s'.format(t1-t0))
+
+    def _solve(self, A, b, D, verbose):
+        # solves the regularized problem for a stacked system (with the background as its last column), and returns the
+        # solution and solve status. The residual is formed per polarization, so the stacked basis matrix is never
+        # assembled
+        D = cvx.Constant(D)
+        x = cvx.Variable(A.shape[1])
+        residuals = [cvx.Constant(block) * x[:-1] + x[-1] - np.ravel(segment)
+                     for block, segment in zip(A.blocks, A.split(b))]
+        objective = cvx.Minimize(cvx.norm2(cvx.hstack(residuals)) + self.alpha * cvx.norm2(D * x))
+        constraints = [x[:-1] >= 0]
+        prob = cvx.Problem(objective, constraints)
+        value, status = solve_problem(prob, x, verbose, self.options)
+        if value is None:
+            return None, status
+        return np.array(value).reshape((-1, 1)), status
@@ -0,0 +1,139 @@
+import itertools
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from .quadratic import solve_quadratic
+
+
+class CandidateFit(object):
+    """Result of fitting a single candidate set of basis types during a model comparison.
+
+    Attributes:
+        basis_names (tuple of str): the basis types included in the candidate model.
+        rates (dict): contains 1D arrays with the solved wavelength-dependent emission rates for each included basis
+            type.
+        background (float): the solved constant background term.
+        residual_norm (float): the 2-norm of the fit residual, ``||Ax + eta - b||``, excluding the regularization term.
+        n_parameters (int): the number of solved variables (rates of every included column and the background).
+        aic (float): the Akaike information criterion of the fit.
+        bic (float): the Bayesian information criterion of the fit.
+    """
+    def __init__(self, basis_names, rates, background, residual_norm, n_parameters, aic, bic):
+        self.basis_names = basis_names
+        self.rates = rates
+        self.background = background
+        self.residual_norm = residual_norm
+        self.n_parameters = n_parameters
+        self.aic = aic
+        self.bic = bic
+
+
+def candidate_subsets(basis_names):
+    """Lists every non-empty subset of a set of basis types, from smallest to largest.
+
+    Args:
+        basis_names (list of str): the basis types of the full model, e.g. ``['ED', 'MD']``.
+
+    Returns (list of tuple of str):
+        The candidate subsets, each preserving the column order of ``basis_names``.
+    """
+    return [subset for size in range(1, len(basis_names) + 1)
+            for subset in itertools.combinations(basis_names, size)]
+
+
+def information_criteria(residual_norm, n_samples, n_parameters):
+    """Computes the Akaike and Bayesian information criteria of a least squares fit with Gaussian residuals.
+
+    Args:
+        residual_norm (float): the 2-norm of the fit residual.
+        n_samples (int): the number of fitted pixels.
+        n_parameters (int): the number of solved variables.
+
+    Returns (tuple of float):
+        The ``(aic, bic)`` pair. Lower values indicate a preferable model.
+    """
+    log_likelihood = n_samples * np.log(max(residual_norm ** 2, np.finfo(float).tiny) / n_samples)
+    return log_likelihood + 2 * n_parameters, log_likelihood + n_parameters * np.log(n_samples)
+
+
+def compare_models(model, bases, observations, candidates=None, processes=None, verbose=False):
+    """Fits nested candidate models that use subsets of the basis types of a single full basis.
+
+    Candidate models (e.g. ``('ED',)``, ``('MD',)`` and ``('ED', 'MD')``) are column subsets of the full basis, so
+    the full bases are built and the regularized Gram matrix (A^T*A + alpha^2*D^T*D) and (A^T*b) are formed only once.
+    Because the smoothness operator is block-diagonal across basis types, every candidate's quadratic problem is
+    exactly the corresponding sub-block of the full problem. The candidates are then solved in parallel processes and
+    ranked by their residual norms and information criteria.
+
+    Candidates are always solved in the quadratic form used by the ``Quadratic`` model, with the ``alpha``, ``order``
+    and ``weighted`` settings of ``model``. The parameter count used for the information criteria is the number of
+    solved variables, which overestimates the effective degrees of freedom of a regularized fit.
+
+    Args:
+        model (Model): the model supplying the regularization settings. It is not modified: bases and observations
+            are loaded into a copy of it.
+        bases (list of Basis): the full basis objects (built or not) of several polarizations.
+        observations (list of Observation): the observation objects of several polarizations.
+        candidates (list of tuple of str or None): the subsets of basis names to compare [default None, every
+            non-empty subset of the full basis names].
+        processes (int or None): the number of worker processes. ``1`` solves the candidates serially in the current
+            process [default None, one per core].
+        verbose (bool): the console verbosity of the called solver (MOSEK) [default False].
+
+    Returns (list of CandidateFit or None):
+        One result per candidate, in the order of ``candidates``, or None for a candidate whose solve failed.
+    """
+    model = model._solver_copy()
+    model._load(bases, observations)
+    if candidates is None:
+        candidates = candidate_subsets(model.basis_names)
+    for subset in candidates:
+        for name in subset:
+            if name not in model.basis_names:
+                raise ValueError('Basis name {0} is not part of the full basis {1}.'.format(name, model.basis_names))
+
+    t0 = time.time()
+    print('Forming full QP problem for {0} candidate models'.format(len(candidates)))
+    A, b, D = model._system()
+    data_gram = A.gram()
+    full_gram = (data_gram + model.alpha ** 2 * (D.T @ D)).tocsc()
+    q = A.H @ b
+    bb = (b.T @ b).item()
+
+    basis = model.bases[0]
+    w_count = basis.basis_parameters.wavelength_count
+    centers = basis.column_pixels()
+    kept = np.flatnonzero((centers >= 0) & (centers < model.observations[0].dispersed_pixel_count))
+    problems = []
+    subset_columns = []
+    for subset in candidates:
+        blocks = [model.basis_names.index(name) * w_count + np.arange(w_count) for name in subset]
+        columns = np.concatenate(blocks + [[A.shape[1] - 1]])
+        problems.append((full_gram[columns, :][:, columns].toarray(), q[columns], bb, verbose))
+        subset_columns.append(columns)
+
+    print('Solving candidate models')
+    if processes == 1 or len(problems) == 1:
+        solutions = [solve_quadratic(*problem)[0] for problem in problems]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            solutions = list(pool.map(_solve_candidate, problems))
+
+    results = []
+    for subset, columns, x in zip(candidates, subset_columns, solutions):
+        if x is None:
+            results.append(None)
+            continue
+        rss = (x.T @ (data_gram[columns, :][:, columns] @ x)).item() - 2 * (q[columns].T @ x).item() + bb
+        residual_norm = np.sqrt(max(rss, 0.0))
+        aic, bic = information_criteria(residual_norm, b.shape[0], len(columns))
+        rates = {name: x[i * w_count + kept] for i, name in enumerate(subset)}
+        results.append(CandidateFit(tuple(subset), rates, x[-1].item(), residual_norm, len(columns), aic, bic))
+        print('    {0:<20s} residual: {1:.6g}    AIC: {2:.6g}    BIC: {3:.6g}'.format(
+            '+'.join(subset), residual_norm, aic, bic))
+    print('Comparison DONE:\n    Elapsed time: {0:.2f} s'.format(time.time() - t0))
+    return results
+
+
+def _solve_candidate(problem):
+    return solve_quadratic(*problem)[0]
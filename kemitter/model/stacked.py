@@ -0,0 +1,142 @@
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.linalg import LinearOperator
+
+
+class StackedSystem(LinearOperator):
+    """The stacked basis matrix of several polarizations, with the constant background column appended.
+
+    The system matrix ``[B_1, 1; B_2, 1; ...]`` is never assembled. The basis matrix ``B_i`` of each polarization is
+    referenced in place and every product is evaluated block by block, so forming the system costs no memory beyond the
+    bases themselves. The background column is handled implicitly.
+
+    When the matrix-free views of the blocks are given (see :func:`~kemitter.basis.basis.Basis.as_operator`), the
+    products and Gram contributions of the blocks are evaluated by their parallel banded kernels instead of sparse
+    matrix products.
+
+    The operator is compatible with ``scipy.sparse.linalg.LinearOperator``, and ``A.H @ b`` evaluates (A^T*b).
+
+    Attributes:
+        blocks (list of csc_matrix): the basis matrix (or its fitted rows and columns) of each polarization.
+        operators (list of StructuredBasisOperator or None): the matrix-free views of the blocks, or None.
+        offsets (ndarray): 1D array of the first row of each block in the stacked system, followed by the total row
+            count.
+    """
+    def __init__(self, blocks, operators=None):
+        self.blocks = [sp.csc_matrix(block) for block in blocks]
+        self.operators = operators
+        if len({block.shape[1] for block in self.blocks}) != 1:
+            raise ValueError('Stacked basis matrices must have the same number of columns.')
+        if operators is not None and [op.shape for op in operators] != [block.shape for block in self.blocks]:
+            raise ValueError('Structured operators must match the shapes of the stacked basis matrices.')
+        self.offsets = np.cumsum([0] + [block.shape[0] for block in self.blocks])
+        super().__init__(np.float64, (int(self.offsets[-1]), self.blocks[0].shape[1] + 1))
+
+    def split(self, y):
+        """Splits a vector (or the rows of a 2D array) of the stacked system into the segments of each block.
+
+        Args:
+            y (ndarray): an array with one row per row of the stacked system.
+
+        Returns (list of ndarray):
+            The views of ``y`` belonging to each polarization.
+        """
+        return [y[self.offsets[i]:self.offsets[i + 1]] for i in range(len(self.blocks))]
+
+    def column_sums(self):
+        """Returns (ndarray): 1D array of the column sums of the stacked basis matrices, without the background."""
+        return sum(self._block_sums(i) for i in range(len(self.blocks)))
+
+    def block_gram(self, i):
+        """Forms the contribution of a single block to the Gram matrix (A^T*A).
+
+        The background row and column hold the column sums of the block and its row count.
+
+        Args:
+            i (int): the index of the block (polarization).
+
+        Returns (csc_matrix):
+            The sparse contribution, including the trailing background row and column.
+        """
+        block = self.blocks[i]
+        sums = self._block_sums(i)
+        product = block.T @ block if self.operators is None else self.operators[i].gram()
+        return sp.bmat([[product, sp.csc_matrix(sums.reshape((-1, 1)))],
+                        [sp.csc_matrix(sums.reshape((1, -1))), sp.csc_matrix([[float(block.shape[0])]])]],
+                       format='csc')
+
+    def block_rmatvec(self, i, y):
+        """Computes the contribution of a single block to (A^T*y).
+
+        Args:
+            i (int): the index of the block (polarization).
+            y (ndarray): 1D array of the rows of the block, e.g. ``self.split(y)[i]``.
+
+        Returns (ndarray):
+            1D array with one entry per column of the stacked system.
+        """
+        y = np.ravel(y)
+        return np.append(self._block_rproduct(i, y), y.sum())
+
+    def gram(self):
+        """Forms the Gram matrix (A^T*A) as the sum of the contributions of each block.
+
+        Returns (csc_matrix):
+            The sparse Gram matrix, including the trailing background row and column.
+        """
+        return sum((self.block_gram(i) for i in range(1, len(self.blocks))), self.block_gram(0))
+
+    def tocsc(self):
+        """Returns (csc_matrix): the assembled stacked system (for small systems and testing only)."""
+        ones = sp.csc_matrix(np.ones((self.shape[0], 1)))
+        return sp.hstack((sp.vstack(self.blocks), ones), format='csc')
+
+    def _block_sums(self, i):
+        if self.operators is None:
+            return np.asarray(self.blocks[i].sum(axis=0)).ravel()
+        return self.operators[i].column_sums()
+
+    def _block_product(self, i, x):
+        # B_i @ x, matrix-free if the view of the block is given
+        return self.blocks[i] @ x if self.operators is None else self.operators[i] @ x
+
+    def _block_rproduct(self, i, y):
+        # B_i^T @ y, matrix-free if the view of the block is given
+        return self.blocks[i].T @ y if self.operators is None else self.operators[i].H @ y
+
+    def _matvec(self, x):
+        x = np.ravel(x)
+        return np.concatenate([self._block_product(i, x[:-1]) for i in range(len(self.blocks))]) + x[-1]
+
+    def _matmat(self, X):
+        return np.vstack([self._block_product(i, X[:-1]) for i in range(len(self.blocks))]) + X[-1:]
+
+    def _rmatvec(self, y):
+        y = np.ravel(y)
+        products = [self._block_rproduct(i, segment) for i, segment in enumerate(self.split(y))]
+        return np.append(sum(products[1:], products[0]), y.sum())
+
+    def _rmatmat(self, Y):
+        products = [self._block_rproduct(i, segment) for i, segment in enumerate(self.split(Y))]
+        return np.vstack((sum(products[1:], products[0]), Y.sum(axis=0, keepdims=True)))
+
+    def _adjoint(self):
+        return _AdjointStackedSystem(self)
+
+
+class _AdjointStackedSystem(LinearOperator):
+    def __init__(self, system):
+        self.system = system
+        super().__init__(np.float64, (system.shape[1], system.shape[0]))
+
+    def _matvec(self, y):
+        return self.system._rmatvec(y)
+
+    def _matmat(self, Y):
+        return self.system._rmatmat(np.asarray(Y))
+
+    def _rmatvec(self, x):
+        return self.system._matvec(x)
+
+    def _adjoint(self):
+        return self.system
@@ -0,0 +1,246 @@
+import os
+import hashlib
+import itertools
+import numpy as np
+from .fitting import FitResult
+from .options import FAILED
+
+
+class ResultStore(object):
+    """Chunked, compressed HDF5 file accumulating the results of a fit campaign.
+
+    Every quantity of a ``FitResult`` is stored as its own resizable dataset with one row per fit, e.g. ``rates/<basis
+    name>``, ``counts/<basis name>``, ``percent_emission/<basis name>``, ``total_emission``,
+    ``polarization_counts/<angle>``, ``background`` and ``solver_result`` (and optionally ``fits/<angle>``). Each row is
+    indexed by the ``frame`` dataset and carries its provenance in the ``status``, ``alpha`` and ``fingerprint``
+    datasets. The wavelengths of the rates are stored once, in ``wavelength``.
+
+    Datasets are chunked along the fits and compressed, so reading one rate column of 100k fits only decompresses the
+    chunks of that dataset, and reading a range of fits only decompresses the chunks holding it.
+
+    The file is written by a single writer at a time (HDF5 locks it). Once its layout is created, it is written in
+    single-writer/multiple-reader (SWMR) mode, so analyses can read it while a campaign is still appending results.
+
+    Requires `h5py`.
+
+    Attributes:
+        path (str): the path to the HDF5 file.
+        chunk_size (int): the number of fits per chunk of every dataset, also the number of results buffered before
+            they are written.
+        compression (str or None): the HDF5 compression filter of the datasets.
+    """
+    def __init__(self, path, chunk_size=256, compression='gzip'):
+        if chunk_size < 1:
+            raise ValueError('Chunk size must be a positive integer, not {0}.'.format(chunk_size))
+        self.path = path
+        self.chunk_size = chunk_size
+        self.compression = compression
+
+    def __len__(self):
+        if not os.path.isfile(self.path):
+            return 0
+        with self._open('r') as f:
+            return len(f['frame']) if 'frame' in f else 0
+
+    @property
+    def fields(self):
+        """list of str: the paths of the datasets holding one row per fit."""
+        if not os.path.isfile(self.path):
+            return []
+        with self._open('r') as f:
+            if 'frame' not in f:
+                return []
+            names = []
+            f.visititems(lambda name, item: names.append(name) if _is_field(item) else None)
+            return names
+
+    def append(self, results, frames=None, fingerprint='', alpha=np.nan, fits=False):
+        """Appends fit results to the store.
+
+        ``results`` can be a lazy iterable, e.g. the generator returned by :func:`~kemitter.model.fit_many`. Results
+        are written every ``chunk_size`` fits, so memory stays bounded however many fits are appended.
+
+        Args:
+            results (FitResult or iterable of FitResult): the results to append. None entries (failed fits) are stored
+                as NaN rows with a ``FAILED`` status.
+            frames (iterable of int or None): the frame (or sample) index of every result [default None, consecutive
+                indices following the last stored frame].
+            fingerprint (str): the fingerprint of the fitted bases, e.g. from :func:`basis_fingerprint` [default ''].
+            alpha (float): the regularization parameter of the fitting model [default NaN].
+            fits (bool): whether to store the reconstructed fit images of the results too [default False]. Only used
+                when the layout of the store is created.
+
+        Returns (int):
+            The number of appended results.
+
+        Raises:
+            ValueError: if the results do not match the layout of the store, or if no result defines the layout of a
+                new store.
+        """
+        if results is None or isinstance(results, FitResult):
+            results = [results]
+        with self._open('a') as f:
+            if frames is None:
+                start = int(f['frame'][-1]) + 1 if 'frame' in f and len(f['frame']) else 0
+                frames = itertools.count(start)
+            frames = iter(frames)
+            count = 0
+            pending = []
+            for result in results:
+                pending.append((next(frames), result))
+                if len(pending) >= self.chunk_size and self._write(f, pending, fingerprint, alpha, fits):
+                    count += len(pending)
+                    pending = []
+            if pending:
+                if not self._write(f, pending, fingerprint, alpha, fits):
+                    raise ValueError('The layout of a new result store cannot be defined by failed fits only.')
+                count += len(pending)
+        return count
+
+    def read(self, field, items=slice(None)):
+        """Reads a range of rows of one dataset, decompressing only the chunks holding them.
+
+        Args:
+            field (str): the dataset path, e.g. ``'rates/ED'``, ``'background'`` or ``'status'`` (see ``fields``).
+            items (slice, int or ndarray): the fits to read, as an index into the rows [default every fit].
+
+        Returns (ndarray):
+            The selected rows, as strings for ``status`` and ``fingerprint``.
+        """
+        with self._open('r') as f:
+            values = f[field][items]
+        if field in ('status', 'fingerprint'):
+            values = np.char.decode(values, 'ascii')
+        return values
+
+    @property
+    def wavelength(self):
+        """ndarray: the wavelengths of the stored rates."""
+        with self._open('r') as f:
+            return f['wavelength'][()]
+
+    @property
+    def basis_names(self):
+        """list of str: the names of the basis types of the stored fits."""
+        with self._open('r') as f:
+            return [name.decode('ascii') for name in f.attrs['basis_names']]
+
+    def _open(self, mode):
+        # imported here, so that fitting does not require h5py
+        import h5py
+        if mode == 'r':
+            return h5py.File(self.path, 'r', libver='latest', swmr=True)
+        f = h5py.File(self.path, mode, libver='latest')
+        if 'frame' in f:
+            f.swmr_mode = True
+        return f
+
+    def _write(self, f, pending, fingerprint, alpha, fits):
+        # writes buffered (frame, result) pairs, returns False if the layout of the file cannot be defined yet
+        results = [result for _, result in pending]
+        if 'frame' not in f:
+            template = next((result for result in results if result is not None), None)
+            if template is None:
+                return False
+            self._create(f, template, fits)
+        columns = {'frame': [frame for frame, _ in pending],
+                   'status': [FAILED if result is None else result.status for result in results],
+                   'alpha': [alpha] * len(pending),
+                   'fingerprint': [fingerprint] * len(pending)}
+        for name, getter in _field_getters(f):
+            shape = f[name].shape[1:]
+            rows = np.full((len(pending),) + shape, np.nan)
+            for i, result in enumerate(results):
+                if result is not None:
+                    value = getter(result)
+                    if np.shape(value) != shape:
+                        raise ValueError('Result of frame {0} does not match the layout of dataset {1}.'.format(
+                            pending[i][0], name))
+                    rows[i] = value
+            columns[name] = rows
+        # every row is validated before any dataset is resized, so that all datasets keep the same length
+        start = len(f['frame'])
+        stop = start + len(pending)
+        for name, values in columns.items():
+            dataset = f[name]
+            dataset.resize(stop, axis=0)
+            dataset[start:stop] = np.asarray(values, dtype=dataset.dtype)
+        f.flush()
+        return True
+
+    def _create(self, f, result, fits):
+        if fits and result.fits is None:
+            raise ValueError('Fit images cannot be stored for results without reconstructed fits.')
+        f.attrs['basis_names'] = np.array(result.basis_names, dtype='S')
+        f.attrs['polarization_angles'] = np.array(result.polarization_angles, dtype=np.float64)
+        f.attrs['fits'] = bool(fits)
+        f.create_dataset('wavelength', data=result.wavelength)
+        shapes = [('frame', (), np.int64), ('status', (), 'S24'), ('alpha', (), np.float64),
+                  ('fingerprint', (), 'S40')]
+        shapes += [(name, np.shape(getter(result)), np.float64) for name, getter in _field_getters(f)]
+        for name, shape, dtype in shapes:
+            # fit images are chunked one by one, so that reading a single image stays cheap
+            chunk = 1 if len(shape) > 1 else self.chunk_size
+            f.create_dataset(name, shape=(0,) + shape, maxshape=(None,) + shape, chunks=(chunk,) + shape,
+                             dtype=dtype, compression=self.compression, shuffle=self.compression is not None,
+                             fillvalue=np.nan if dtype == np.float64 else None)
+        f.swmr_mode = True
+
+
+def basis_fingerprint(bases):
+    """Computes a fingerprint identifying a set of built bases, for the provenance of stored results.
+
+    Bases are identified by the parameters they were built from rather than by their matrices, so fingerprinting
+    costs the same for bases of any size.
+
+    Args:
+        bases (list of Basis): the built bases of several polarizations.
+
+    Returns (str):
+        The hexadecimal SHA-1 digest of the basis types, polarization angles, basis names, basis parameters and basis
+        matrix shapes and nonzero counts.
+    """
+    if not isinstance(bases, list):
+        bases = [bases]
+    digest = hashlib.sha1()
+    for basis in bases:
+        if not basis.is_built:
+            raise ValueError('Basis of polarization angle {0} must be built before fingerprinting.'.format(
+                basis.pol_angle))
+        matrix = basis.basis_matrix
+        digest.update(repr((type(basis).__name__, float(basis.pol_angle), list(basis.basis_names), matrix.shape,
+                            matrix.nnz)).encode())
+        for name, value in sorted(vars(basis.basis_parameters).items()):
+            if isinstance(value, np.ndarray):
+                value = (value.dtype.str, value.shape, np.ascontiguousarray(value).tobytes())
+            digest.update(repr((name, value)).encode())
+    return digest.hexdigest()
+
+
+def _field_getters(f):
+    # the (dataset path, FitResult accessor) pairs of the layout of a store
+    names = [name.decode('ascii') for name in f.attrs['basis_names']]
+    angles = [_angle(angle) for angle in f.attrs['polarization_angles']]
+    getters = [('background', lambda result: result.background),
+               ('solver_result', lambda result: result.solver_result),
+               ('total_emission', lambda result: result.total_emission)]
+    for quantity in ('rates', 'counts', 'percent_emission'):
+        getters += [('{0}/{1}'.format(quantity, name), _item_getter(quantity, name)) for name in names]
+    getters += [('polarization_counts/{0}'.format(angle), _item_getter('polarization_counts', angle))
+                for angle in angles]
+    if f.attrs['fits']:
+        getters += [('fits/{0}'.format(angle), _item_getter('fits', angle)) for angle in angles]
+    return getters
+
+
+def _item_getter(quantity, key):
+    return lambda result: getattr(result, quantity)[key]
+
+
+def _angle(angle):
+    # polarization angles are stored as floats, but keyed as given (e.g. 0 rather than 0.0) in results
+    return int(angle) if float(angle).is_integer() else float(angle)
+
+
+def _is_field(item):
+    return hasattr(item, 'shape') and item.maxshape is not None and item.maxshape[0] is None
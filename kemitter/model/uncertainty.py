@@ -0,0 +1,209 @@
+import os
+import time
+import numpy as np
+import scipy.sparse as sp
+from multiprocessing import Pool
+from .quadratic import Quadratic, gram
+from .nnqp import solve_nnqp
+
+RESAMPLING_METHODS = ('poisson', 'gaussian', 'bootstrap')
+
+_worker_problem = None  # (P, x0, tol) shared by every replicate solved in a worker process
+
+
+class RateUncertainty(object):
+    """Resampling-based uncertainty estimate of the solved rates of a model.
+
+    Attributes:
+        method (str): the noise model used to resample the observations.
+        percentiles (tuple of float): the percentiles (between 0 and 100) reported in each band.
+        bands (dict): contains 2D arrays of shape ``(len(percentiles), n_rates)`` with the percentiles of the resampled
+            emission rates of each basis type, in the order of ``percentiles``.
+        standard_deviations (dict): contains 1D arrays with the standard deviation of the resampled emission rates of
+            each basis type.
+        background_band (ndarray): 1D array of the percentiles of the resampled background term.
+        replicates (int): the number of solved replicates.
+        unconverged (int): the number of replicates whose solver stopped at its sweep limit before reaching the
+            requested tolerance.
+        samples (dict or None): contains 2D arrays of shape ``(replicates, n_rates)`` with every resampled rate of each
+            basis type, if they were kept.
+    """
+    def __init__(self, method, percentiles, rate_samples, background_samples, unconverged, keep_samples=False):
+        self.method = method
+        self.percentiles = tuple(percentiles)
+        self.bands = {name: np.percentile(samples, percentiles, axis=0) for name, samples in rate_samples.items()}
+        self.standard_deviations = {name: samples.std(axis=0) for name, samples in rate_samples.items()}
+        self.background_band = np.percentile(background_samples, percentiles)
+        self.replicates = len(background_samples)
+        self.unconverged = unconverged
+        self.samples = rate_samples if keep_samples else None
+
+
+def resample(fit, residual, method, n_parameters, rng, size=1):
+    """Draws resampled observation vectors around a fit.
+
+    Args:
+        fit (ndarray): 1D array of the fitted observation vector, ``Ax + eta``.
+        residual (ndarray): 1D array of the fit residual, ``b - (Ax + eta)``.
+        method (str): ``'poisson'`` draws Poisson counts with the fit as their mean, ``'gaussian'`` adds white noise
+            with the variance of the residual, and ``'bootstrap'`` adds residuals drawn with replacement from all
+            pixels.
+        n_parameters (int): the number of solved variables, used for the degrees of freedom of the residual variance.
+        rng (numpy.random.RandomState): the random number generator.
+        size (int): the number of replicates to draw [default 1].
+
+    Returns (ndarray):
+        2D array with one resampled observation vector per column.
+    """
+    shape = (len(fit), size)
+    if method == 'poisson':
+        return rng.poisson(np.maximum(fit, 0.0)[:, None], size=shape).astype(np.float64)
+    elif method == 'gaussian':
+        sigma = np.linalg.norm(residual) / np.sqrt(max(len(fit) - n_parameters, 1))
+        return fit[:, None] + rng.normal(0.0, sigma, size=shape)
+    elif method == 'bootstrap':
+        return fit[:, None] + residual[rng.randint(0, len(residual), size=shape)]
+    else:
+        raise ValueError('Resampling method must be one of {0}, not {1}.'.format(RESAMPLING_METHODS, method))
+
+
+def replicate_solutions(model, replicates=100, method='poisson', processes=None, seed=None, batch_size=None,
+                        tol=1e-6):
+    """Solves the problem of a solved model for resampled observations, yielding the solutions as they complete.
+
+    The stacked system of the model is assembled once and its regularized Gram matrix is formed once (or pulled from
+    the cache of the model), since resampling only changes the observation. The polarization weights of the model
+    (see ``Quadratic.set_weight()``) apply to both the Gram matrix and the replicates. Each replicate therefore
+    reduces to the (A^T*b) product of its resampled observation, which is formed in the current process for a whole
+    batch at a time. Batches are solved in parallel processes with the native :func:`~kemitter.model.nnqp.solve_nnqp`
+    solver, warm-started from the model's solution, and the Gram matrix is sent to each worker only once.
+
+    Args:
+        model (Quadratic): a solved ``Quadratic`` model. Replicates are solved in its quadratic form with its
+            ``alpha``, smoothness settings and polarization weights, over the same wavelength window.
+        replicates (int): the total number of replicates [default 100].
+        method (str): the resampling method (see :func:`resample`) [default 'poisson'].
+        processes (int or None): the number of worker processes. ``1`` solves the replicates serially in the current
+            process [default None, one per core].
+        seed (int or None): the seed of the random number generator [default None].
+        batch_size (int or None): the number of replicates per task [default None, spread evenly over the workers].
+        tol (float): the relative KKT tolerance of the replicate solves [default 1e-6].
+
+    Yields (tuple of (ndarray, int)):
+        A 2D array with one replicate solution per column (background last) and the number of unconverged solves in
+        the batch.
+    """
+    if not isinstance(model, Quadratic):
+        # the replicates solve the quadratic problem, which only matches the point estimate of a Quadratic model
+        raise ValueError('Resampled uncertainties require a Quadratic model, not {0}.'.format(type(model).__name__))
+    if model.solver_result is None:
+        raise RuntimeError('The model must be solved before its uncertainty can be estimated.')
+    if method not in RESAMPLING_METHODS:
+        raise ValueError('Resampling method must be one of {0}, not {1}.'.format(RESAMPLING_METHODS, method))
+    A, b, D = model._system(model.wavelength_window)
+    x0 = np.ravel(model.solver_result)
+    if x0.shape[0] != A.shape[1]:
+        raise RuntimeError('The model solution does not match its stacked system of {0} columns.'.format(A.shape[1]))
+    weights = [model.polarization_weights.get(angle, 1.0) for angle in model.polarization_angles]
+    # the weight of every row of the stacked system, applied to the resampled observations
+    row_weights = np.concatenate([np.full(A.offsets[i + 1] - A.offsets[i], weight)
+                                  for i, weight in enumerate(weights)])
+    if _matching_cache(model, A, weights):
+        P = sp.csr_matrix(model.cache)
+    elif all(weight == 1.0 for weight in weights):
+        P = sp.csr_matrix(gram(A, D, model.alpha))
+    else:
+        P = (model.alpha ** 2 * (D.T @ D)).tocsr()
+        for i, weight in enumerate(weights):
+            P = P + weight * A.block_gram(i)
+        P = P.tocsr()
+
+    fit = A @ x0
+    residual = np.ravel(b) - fit
+    rng = np.random.RandomState(seed)
+    if batch_size is None:
+        workers = 1 if processes == 1 else (processes or os.cpu_count() or 1)
+        batch_size = max(1, int(np.ceil(replicates / (4 * workers))))
+    sizes = [min(batch_size, replicates - start) for start in range(0, replicates, batch_size)]
+
+    def batches():
+        for size in sizes:
+            yield np.asarray(A.H @ (row_weights[:, None] * resample(fit, residual, method, A.shape[1], rng, size)))
+
+    if processes == 1:
+        _init_worker(P, x0, tol)
+        for Q in batches():
+            yield _solve_batch(Q)
+        return
+    # a multiprocessing pool sends the problem to each worker once, as process pool executors only accept an
+    # initializer from Python 3.7
+    with Pool(processes, initializer=_init_worker, initargs=(P, x0, tol)) as pool:
+        for solved in pool.imap_unordered(_solve_batch, batches()):
+            yield solved
+
+
+def bootstrap(model, replicates=100, method='poisson', percentiles=(2.5, 50, 97.5), processes=None, seed=None,
+              batch_size=None, tol=1e-6, keep_samples=False):
+    """Estimates percentile bands of the solved rates of a model by resampling its observations.
+
+    See :func:`replicate_solutions` for how the replicates are formed and solved.
+
+    Args:
+        model (Model): a solved model.
+        replicates (int): the number of replicates [default 100].
+        method (str): the resampling method, ``'poisson'``, ``'gaussian'`` or ``'bootstrap'`` (see
+            :func:`resample`) [default 'poisson'].
+        percentiles (tuple of float): the percentiles (between 0 and 100) of each band
+            [default (2.5, 50, 97.5)].
+        processes (int or None): the number of worker processes [default None, one per core].
+        seed (int or None): the seed of the random number generator [default None].
+        batch_size (int or None): the number of replicates per task [default None].
+        tol (float): the relative KKT tolerance of the replicate solves [default 1e-6].
+        keep_samples (bool): whether to keep every resampled rate in the result [default False].
+
+    Returns (RateUncertainty):
+        The percentile bands of every rate.
+    """
+    t0 = time.time()
+    print('Resampling {0} replicates ({1})'.format(replicates, method))
+    _, _, block_width, kept = model._result_layout()
+    solutions = []
+    unconverged = 0
+    for X, failed in replicate_solutions(model, replicates, method, processes, seed, batch_size, tol):
+        solutions.append(X)
+        unconverged += failed
+        print('    {0}/{1} replicates solved'.format(sum(s.shape[1] for s in solutions), replicates))
+    X = np.hstack(solutions)
+    rate_samples = {name: X[i * block_width + kept, :].T for i, name in enumerate(model.basis_names)}
+    if unconverged:
+        print('    {0} replicates did not reach the requested tolerance'.format(unconverged))
+    print('Resampling DONE:\n    Elapsed time: {0:.2f} s'.format(time.time() - t0))
+    return RateUncertainty(method, percentiles, rate_samples, X[-1, :], unconverged, keep_samples)
+
+
+def _matching_cache(model, A, weights):
+    # whether the cached Gram matrix of the model was formed by a cached run over the same window, with the current
+    # polarization weights
+    if model.cache is None or model._cache_terms is None or model.cache.shape != (A.shape[1], A.shape[1]):
+        return False
+    setup, terms = model._cache_terms
+    cached_weights = {angle: weight for (angle, _), (weight, _) in terms.items() if weight}
+    current_weights = {angle: weight for angle, weight in zip(model.polarization_angles, weights) if weight}
+    return setup[:4] == (model.wavelength_window, model.alpha, model.order, model.weighted) and \
+        cached_weights == current_weights
+
+
+def _init_worker(P, x0, tol):
+    global _worker_problem
+    _worker_problem = (P, x0, tol)
+
+
+def _solve_batch(Q):
+    P, x0, tol = _worker_problem
+    X = np.zeros(Q.shape)
+    unconverged = 0
+    for i in range(Q.shape[1]):
+        x, _, residual, _ = solve_nnqp(P, Q[:, i], x0=x0, tol=tol)
+        X[:, i] = x[:, 0]
+        unconverged += residual > tol
+    return X, unconverged
@@ -0,0 +1,204 @@
+import os
+import glob
+import time
+import traceback
+from collections import deque
+import numpy as np
+from ..obsrv.spe import SpeFile, HEADER_SIZE
+from ..obsrv.observation import Observation
+from .quadratic import Quadratic
+from .store import basis_fingerprint
+from .fitting import _fit
+
+
+class AcquisitionWatcher(object):
+    """Live fitting of the SPE files written into an acquisition directory, for feedback during an experiment.
+
+    The directory is polled every ``interval`` seconds. A new file is complete once its size has not changed between two
+    polls and its footer, which is written last and holds the wavelength calibration, can be read. A file whose size has
+    settled but which stays unreadable for ``timeout`` seconds is counted as failed. Complete files are queued, and the
+    queued files are fit one at a time, oldest first. The queue holds at most ``max_queue`` files: when files arrive
+    faster than they are fit, the oldest waiting files are dropped, so the fits keep up with the latest acquisition
+    instead of falling ever further behind.
+
+    Every file is fit against the same built bases with a private copy of the model, so a ``Quadratic`` model forms
+    its regularized Gram matrix once, on the first file, and every later fit only forms ``A^T*b`` and solves. The
+    latency of a fit is measured from the modification time of the file to the publication of its result.
+
+    Attributes:
+        model (Model): the model defining the problem. Only its hyperparameters and solver options are used.
+        bases (list of Basis): the built bases, one per polarization, matching the observations of every file.
+        directory (str): the acquisition directory.
+        rois (list of tuple): ``(rows, pol_angle)`` pairs, one per basis, giving the sensor rows of each polarization
+            (see :func:`~kemitter.obsrv.observation.Observation.from_spe_rois`).
+        results (ResultStore or None): the store to which every result is appended, indexed by the sequence number of
+            its file.
+        pattern (str): the glob pattern of the acquired files.
+        interval (float): the polling interval, in seconds.
+        timeout (float): the time a file of settled size may stay unreadable before it is counted as failed, in
+            seconds.
+        region (int): the index of the region of interest read from the files.
+        method (str): how the frames of a file are combined (see
+            :class:`~kemitter.obsrv.accumulate.FrameAccumulator`).
+        calibration (Calibration or None): the calibration applied to the observations.
+        wavelength_range (tuple of float or None): the (min, max) wavelengths to fit.
+        callback (callable or None): called as ``callback(filepath, result, latency)`` after every fit, e.g. to
+            update a plot.
+        fitted (int): the number of files fit.
+        dropped (int): the number of files dropped from a full queue.
+        failed (int): the number of files that could not be read or fit.
+        latencies (deque of float): the latencies of the last 1000 fits, in seconds.
+    """
+    def __init__(self, model, bases, directory, rois, results=None, pattern='*.spe', interval=0.1, timeout=10.0,
+                 max_queue=2, region=0, method='sum', calibration=None, wavelength_range=None, callback=None,
+                 existing=False):
+        if not isinstance(bases, list):
+            bases = [bases]
+        if len(rois) != len(bases):
+            raise ValueError('{0} regions of interest do not match {1} bases.'.format(len(rois), len(bases)))
+        if max_queue < 1:
+            raise ValueError('Queue length must be a positive integer, not {0}.'.format(max_queue))
+        self.model = model
+        self.bases = bases
+        self.directory = directory
+        self.rois = rois
+        self.results = results
+        self.pattern = pattern
+        self.interval = interval
+        self.timeout = timeout
+        self.region = region
+        self.method = method
+        self.calibration = calibration
+        self.wavelength_range = wavelength_range
+        self.callback = callback
+        self.fitted = 0
+        self.dropped = 0
+        self.failed = 0
+        self.latencies = deque(maxlen=1000)
+        self._solver = model._solver_copy()
+        self._fingerprint = basis_fingerprint(bases) if results is not None else ''
+        self._queue = deque(maxlen=max_queue)
+        self._sizes = {}  # path -> (size, time it was first seen) of the new files not yet queued
+        self._seen = set() if existing else set(self._listing())
+        self._index = 0
+
+    @property
+    def metrics(self):
+        """dict: the number of fitted, dropped and failed files, and the median and maximum latencies of the recent
+        fits, in seconds (NaN before the first fit)."""
+        latencies = np.array(self.latencies)
+        return {'fitted': self.fitted,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'median_latency': np.median(latencies) if len(latencies) else np.nan,
+                'max_latency': latencies.max() if len(latencies) else np.nan}
+
+    def run(self, duration=None, max_files=None):
+        """Watches the directory and fits every new file, until interrupted (e.g. with Ctrl+C).
+
+        Args:
+            duration (float or None): the time to watch for, in seconds [default None, no limit].
+            max_files (int or None): the number of files after which to stop [default None, no limit].
+
+        Returns (dict):
+            The final ``metrics``.
+        """
+        t0 = time.time()
+        print('Watching {0} for new files'.format(self.directory))
+        try:
+            while duration is None or time.time() - t0 < duration:
+                if max_files is not None and self.fitted + self.failed >= max_files:
+                    break
+                self.poll()
+                if self._queue:
+                    self._process(self._queue.popleft())
+                else:
+                    time.sleep(self.interval)
+        except KeyboardInterrupt:
+            pass
+        metrics = self.metrics
+        print('Watching DONE:\n    {fitted} files fit, {dropped} dropped, {failed} failed\n    Latency: median '
+              '{median_latency:.2f} s, max {max_latency:.2f} s'.format(**metrics))
+        return metrics
+
+    def poll(self):
+        """Queues the new files that are completely written, dropping the oldest queued files if the queue is full.
+
+        Files whose size has settled but whose footer stays unreadable for ``timeout`` seconds are counted as failed.
+
+        Returns (int):
+            The number of queued files.
+        """
+        for path in self._listing():
+            if path in self._seen:
+                continue
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                # removed since the listing
+                continue
+            previous = self._sizes.get(path)
+            if previous is None or previous[0] != size:
+                self._sizes[path] = (size, time.time())
+                continue
+            if size <= HEADER_SIZE:
+                # no frame has been written yet
+                continue
+            if not _is_complete(path):
+                # the footer is still being written, unless the file stays unreadable
+                if time.time() - previous[1] > self.timeout:
+                    print('    {0} failed: no readable footer after {1:.1f} s'.format(os.path.basename(path),
+                                                                                   time.time() - previous[1]))
+                    del self._sizes[path]
+                    self._seen.add(path)
+                    self.failed += 1
+                continue
+            del self._sizes[path]
+            self._seen.add(path)
+            if len(self._queue) == self._queue.maxlen:
+                print('    Dropped {0}'.format(os.path.basename(self._queue[0])))
+                self.dropped += 1
+            self._queue.append(path)
+        return len(self._queue)
+
+    def _listing(self):
+        # acquisition software numbers consecutive files, so their names sort in the order of acquisition
+        return sorted(glob.glob(os.path.join(self.directory, self.pattern)))
+
+    def _process(self, path):
+        # fits one file, publishes its result and records its latency
+        index = self._index
+        self._index += 1
+        t0 = time.time()
+        try:
+            modified = os.path.getmtime(path)
+            frames = range(SpeFile(path).frame_count)
+            observations = Observation.from_spe_rois(path, self.rois, frames, region=self.region, method=self.method,
+                                                     calibration=self.calibration)
+            if isinstance(self._solver, Quadratic):
+                result = _fit(self._solver, self.bases, observations, wavelength_range=self.wavelength_range,
+                              fits=False, caching=True)
+            else:
+                result = _fit(self._solver, self.bases, observations, wavelength_range=self.wavelength_range,
+                              fits=False)
+            if self.results is not None and (result is not None or len(self.results)):
+                self.results.append(result, frames=[index], fingerprint=self._fingerprint,
+                                    alpha=getattr(self.model, 'alpha', np.nan))
+        except Exception:
+            print('    {0} failed:\n{1}'.format(os.path.basename(path), traceback.format_exc()))
+            self.failed += 1
+            return
+        latency = time.time() - modified
+        self.latencies.append(latency)
+        self.fitted += 1
+        print('    {0}: fit in {1:.2f} s, latency {2:.2f} s'.format(os.path.basename(path), time.time() - t0, latency))
+        if self.callback is not None:
+            self.callback(path, result, latency)
+
+
+def _is_complete(path):
+    # whether the footer of an SPE file, written after the frames, holds the wavelength calibration the fits need
+    try:
+        return SpeFile(path).wavelength is not None
+    except Exception:
+        return False
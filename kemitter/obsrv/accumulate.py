@@ -0,0 +1,189 @@
+import numpy as np
+from numba import jit, prange
+from .spe import accumulation_dtype
+
+METHODS = ('sum', 'mean', 'median', 'clipped')
+
+
+class FrameAccumulator(object):
+    """Streaming per-pixel combination of the frames of an acquisition, with cosmic-ray rejection.
+
+    Frames are added one by one and combined in a single pass by parallel `numba` kernels, so memory is bounded by a
+    few copies of one frame (``k`` frames for the ``'median'`` and ``'clipped'`` methods) however many frames are
+    accumulated. The methods are:
+
+    * ``'sum'``: the sum of the frames, in the type given by :func:`~kemitter.obsrv.spe.accumulation_dtype`.
+    * ``'mean'``: the mean of the frames.
+    * ``'median'``: the mean of the per-pixel medians of consecutive blocks of ``k`` frames.
+    * ``'clipped'``: the sigma-clipped mean. The per-pixel median of the first ``k`` frames seeds the clipping, and
+      every later value farther than ``sigma`` standard deviations from the running mean of the accepted values is
+      rejected.
+
+    A pixel value is counted as rejected when it deviates from its reference (the block median or the running mean) by
+    more than ``sigma`` times the noise, estimated as the larger of the scatter of the accepted values (``'clipped'``
+    only) and the shot noise ``sqrt(max(reference, 1))``. The ``'median'`` method excludes such values by construction.
+
+    Attributes:
+        method (str): the combination method, one of ``'sum'``, ``'mean'``, ``'median'`` or ``'clipped'``.
+        k (int): the number of frames of each median block, and of the frames seeding the clipping.
+        sigma (float): the rejection threshold, in units of the noise.
+        frame_count (int): the number of frames added.
+        rejected (int): the number of pixel values rejected as cosmic rays (or other outliers).
+    """
+    def __init__(self, method='mean', k=3, sigma=5.0):
+        if method not in METHODS:
+            raise ValueError('Accumulation method must be one of {0}, not {1}.'.format(METHODS, method))
+        if k < 1:
+            raise ValueError('Block size must be a positive integer, not {0}.'.format(k))
+        self.method = method
+        self.k = k
+        self.sigma = sigma
+        self.frame_count = 0
+        self.rejected = 0
+        self._shape = None
+        self._total = None  # the running sum (or sum of weighted block medians)
+        self._block = None  # the buffered frames of the current median block, or of the clipping seed
+        self._buffered = 0
+        self._count = None  # the number of accepted values, running mean and sum of squared deviations ('clipped')
+        self._mean = None
+        self._m2 = None
+
+    def add(self, frame):
+        """Adds a frame.
+
+        Args:
+            frame (ndarray): the 2D frame, of any numeric type. Memory-mapped frames are read once.
+        """
+        frame = np.asarray(frame)
+        if self._shape is None:
+            self._shape = frame.shape
+        elif frame.shape != self._shape:
+            raise ValueError('Frame of shape {0} does not match the accumulated frames of shape {1}.'.format(
+                frame.shape, self._shape))
+        values = np.ascontiguousarray(frame).reshape(-1)
+        self.frame_count += 1
+        if self.method in ('sum', 'mean'):
+            if self._total is None:
+                # a single frame keeps its type, it is only widened once a second frame is added
+                self._total = values.copy()
+                return
+            if self._total.dtype != accumulation_dtype(values.dtype):
+                self._total = self._total.astype(accumulation_dtype(values.dtype))
+            _add(self._total, values)
+        elif self.method == 'clipped' and self._count is not None:
+            self.rejected += _add_clipped(values, self.sigma, self._count, self._mean, self._m2)
+        else:
+            if self._block is None:
+                self._block = np.empty((self.k, values.size), dtype=values.dtype)
+            self._block[self._buffered] = values
+            self._buffered += 1
+            if self._buffered == self.k:
+                self._flush()
+
+    def result(self):
+        """Combines the frames added so far. Frames buffered in an incomplete block are included.
+
+        Returns (ndarray):
+            The 2D combined frame as `float`, except for ``'sum'``, which keeps the type of a single frame and sums
+            several frames in the accumulation type.
+        """
+        if not self.frame_count:
+            raise ValueError('No frames have been accumulated.')
+        if self._buffered:
+            self._flush()
+        if self.method == 'sum':
+            combined = self._total.copy()
+        elif self.method == 'clipped':
+            combined = self._mean.copy()
+        else:
+            combined = self._total / self.frame_count
+        return combined.reshape(self._shape)
+
+    def _flush(self):
+        # combines the buffered frames into the running state
+        block = self._block[:self._buffered]
+        if self.method == 'median':
+            if self._total is None:
+                self._total = np.zeros(block.shape[1])
+            self.rejected += _add_median(self._total, block, self.sigma)
+        else:
+            self._count = np.zeros(block.shape[1], dtype=np.int64)
+            self._mean = np.zeros(block.shape[1])
+            self._m2 = np.zeros(block.shape[1])
+            self.rejected += _seed_clipped(block, self.sigma, self._count, self._mean, self._m2)
+            self._block = None
+        self._buffered = 0
+
+
+@jit(nopython=True, parallel=True)
+def _add(total, values):
+    for i in prange(total.size):
+        total[i] += values[i]
+
+
+@jit(nopython=True)
+def _median(values):
+    # the median of a sorted array
+    k = values.size
+    if k % 2:
+        return values[k // 2]
+    return 0.5 * (values[k // 2 - 1] + values[k // 2])
+
+
+@jit(nopython=True, parallel=True)
+def _add_median(total, block, sigma):
+    # adds the median of every pixel over the block, weighted by the number of frames in the block
+    k = block.shape[0]
+    # rejections are counted per pixel and summed afterwards, since older numba versions do not reliably reduce a
+    # scalar incremented inside nested loops of a prange
+    rejected = np.zeros(block.shape[1], np.int32)
+    for i in prange(block.shape[1]):
+        values = np.sort(block[:, i].astype(np.float64))
+        median = _median(values)
+        total[i] += k * median
+        threshold = sigma * np.sqrt(max(median, 1.0))
+        for j in range(k):
+            if abs(values[j] - median) > threshold:
+                rejected[i] += 1
+    return rejected.sum()
+
+
+@jit(nopython=True, parallel=True)
+def _seed_clipped(block, sigma, count, mean, m2):
+    # accepts the values of every pixel within sigma shot-noise deviations of their median
+    k = block.shape[0]
+    rejected = np.zeros(block.shape[1], np.int32)
+    for i in prange(block.shape[1]):
+        values = block[:, i].astype(np.float64)
+        median = _median(np.sort(values))
+        threshold = sigma * np.sqrt(max(median, 1.0))
+        for j in range(k):
+            value = values[j]
+            if abs(value - median) > threshold:
+                rejected[i] += 1
+            else:
+                count[i] += 1
+                delta = value - mean[i]
+                mean[i] += delta / count[i]
+                m2[i] += delta * (value - mean[i])
+    return rejected.sum()
+
+
+@jit(nopython=True, parallel=True)
+def _add_clipped(values, sigma, count, mean, m2):
+    # accepts the value of every pixel within sigma deviations of the running mean (Welford's update), or any value if
+    # every seed value of the pixel was rejected
+    rejected = np.zeros(values.size, np.int32)
+    for i in prange(values.size):
+        value = float(values[i])
+        noise = np.sqrt(max(mean[i], 1.0))
+        if count[i] > 1:
+            noise = max(noise, np.sqrt(m2[i] / (count[i] - 1)))
+        if count[i] and abs(value - mean[i]) > sigma * noise:
+            rejected[i] += 1
+        else:
+            count[i] += 1
+            delta = value - mean[i]
+            mean[i] += delta / count[i]
+            m2[i] += delta * (value - mean[i])
+    return rejected.sum()
@@ -0,0 +1,150 @@
+import os
+import threading
+import numpy as np
+from .spe import SpeFile
+from .accumulate import FrameAccumulator
+
+_reference_cache = {}  # (path, region, method, normalized) -> (modification time, frame, exposure time)
+_reference_lock = threading.Lock()
+
+
+class Calibration(object):
+    """Dark-frame and flat-field (or spectral response) correction of observations.
+
+    Calibration references are given as arrays or as paths to SPE files. Reference files are read once, combined over
+    all their frames, and cached by path and modification time, so the same references are shared by every observation
+    and every ``Calibration`` of a session, and are only read again if the file changes.
+
+    Applying a calibration to an observation only crops the references to the rows of the observation and stores them
+    as its ``dark`` and ``gain``. The raw data is left untouched: the correction ``(data - dark) * gain / flat`` is
+    applied while the raw data is converted into the observation vector of a fit (see
+    :func:`~kemitter.obsrv.observation.Observation.fill_vector`), without any full-frame temporaries.
+
+    The dark reference is the sum of a constant ``bias`` and of a dark signal proportional to the exposure time. When
+    the exposure times of the reference and of an observation are known, the dark signal is scaled to the exposure of
+    the observation, so a single dark reference serves every exposure of a kinetic series.
+
+    Attributes:
+        dark (str, float, ndarray or None): the dark reference: an SPE file path, a constant or a full-sensor 2D frame.
+        flat (str, ndarray or None): the flat-field reference: an SPE file path, a full-sensor 2D frame or a 1D
+            spectral response with one entry per pixel column. It is normalized to a mean of 1.
+        bias (float): the part of the dark reference that does not scale with the exposure time.
+        dark_exposure (float or None): the exposure time of the dark reference, in milliseconds. Read from the dark
+            reference file if None.
+        gain (float or None): a constant gain applied on top of the flat-field correction.
+        region (int): the index of the region of interest read from reference files.
+        method (str): how the frames of reference files are combined (see
+            :class:`~kemitter.obsrv.accumulate.FrameAccumulator`), e.g. ``'clipped'`` to reject cosmic rays.
+    """
+    def __init__(self, dark=None, flat=None, bias=0.0, dark_exposure=None, gain=None, region=0, method='mean'):
+        self.dark = dark
+        self.flat = flat
+        self.bias = bias
+        self.dark_exposure = dark_exposure
+        self.gain = gain
+        self.region = region
+        self.method = method
+        self._derived_cache = {}  # (kind, parameters, id of the source) -> (source array, derived array)
+
+    def apply(self, observation, rows=None, exposure_time=None, frames=1):
+        """Sets the dark offset and gain of an observation from the references.
+
+        Args:
+            observation (Observation): a loaded observation, whose raw data was read from the sensor rows ``rows``.
+            rows (tuple of int or None): the ``(begin, end)`` range of sensor rows of the observation [default None,
+                every row].
+            exposure_time (float or None): the exposure time of each frame of the observation, in milliseconds
+                [default None, the dark reference is not scaled].
+            frames (int): the number of frames summed into the observation, which multiplies the dark offset
+                [default 1].
+
+        Raises:
+            ValueError: if a reference does not match the observation, or if the flat field is not positive.
+        """
+        shape = observation.data.shape
+        rows = (None, None) if rows is None else tuple(rows)
+        if self.dark is not None:
+            dark, reference_exposure = self._reference(self.dark)
+            if self.dark_exposure is not None:
+                reference_exposure = self.dark_exposure
+            scale = frames
+            if exposure_time is not None and reference_exposure:
+                scale = frames * exposure_time / reference_exposure
+            if np.ndim(dark):
+                dark = self._derived(('dark', rows, scale), dark, lambda: self._scaled(
+                    self._cropped(dark, rows, shape, 'Dark'), scale, frames))
+            else:
+                dark = self._scaled(dark, scale, frames)
+            observation.dark = dark
+        if self.flat is None:
+            observation.gain = self.gain
+        else:
+            flat, _ = self._reference(self.flat, normalized=True)
+            if np.ndim(flat) == 1:
+                # a spectral response, shared by every row
+                if len(flat) != shape[1]:
+                    raise ValueError('Spectral response of {0} columns does not match the observation of {1} '
+                                     'columns.'.format(len(flat), shape[1]))
+            else:
+                flat = self._derived(('flat', rows), flat, lambda: self._cropped(flat, rows, shape, 'Flat'))
+            observation.gain = self._derived(('gain', self.gain), flat, lambda: self._inverted(flat))
+
+    def _reference(self, reference, normalized=False):
+        # the combined frame (and exposure time) of a reference, read from a file at most once per modification
+        if not isinstance(reference, str):
+            if np.isscalar(reference):
+                return reference, None
+            frame = self._derived(('reference', normalized), reference, lambda: _combined(
+                np.asarray(reference, dtype=np.float64), normalized))
+            return frame, None
+        path = os.path.abspath(reference)
+        key = (path, self.region, self.method, normalized)
+        modified = os.path.getmtime(path)
+        with _reference_lock:
+            cached = _reference_cache.get(key)
+        if cached is not None and cached[0] == modified:
+            return cached[1:]
+        spe_file = SpeFile(path)
+        accumulator = FrameAccumulator(self.method)
+        for frame in spe_file.frames(self.region):
+            accumulator.add(frame)
+        frame = _combined(accumulator.result(), normalized)
+        with _reference_lock:
+            _reference_cache[key] = (modified, frame, spe_file.exposure_time)
+        return frame, spe_file.exposure_time
+
+    def _derived(self, key, source, compute):
+        # arrays derived from a reference are cached with it, so that every observation of the same rows shares them
+        key = key + (id(source),)
+        if key not in self._derived_cache:
+            self._derived_cache[key] = (source, compute())
+        return self._derived_cache[key][1]
+
+    def _scaled(self, dark, scale, frames):
+        # the dark offset of the summed frames of an observation, with the dark signal scaled to its exposure time
+        if scale == 1 and frames == 1:
+            return dark
+        return frames * self.bias + (dark - self.bias) * scale
+
+    def _inverted(self, flat):
+        if np.any(flat <= 0):
+            raise ValueError('Flat field must be positive over the observation.')
+        return (1.0 if self.gain is None else self.gain) / flat
+
+    @staticmethod
+    def _cropped(frame, rows, shape, name):
+        # the rows of a full-sensor reference matching an observation, in column-major order
+        cropped = frame[slice(*rows)]
+        if cropped.shape != shape:
+            raise ValueError('{0} reference of shape {1} does not match the observation of shape {2}.'.format(
+                name, cropped.shape, shape))
+        return np.asfortranarray(cropped)
+
+
+def _combined(frame, normalized):
+    # a read-only float reference frame, normalized to a mean of 1 for flat fields
+    frame = np.array(frame, dtype=np.float64)
+    if normalized:
+        frame /= frame.mean()
+    frame.setflags(write=False)
+    return frame
@@ -1,4 +1,6 @@
-from ..ui import LoaderUI
+import numpy as np
+from .spe import SpeFile
+from .accumulate import FrameAccumulator
 
 
 class Observation(object):
@@ -9,11 +11,24 @@ class Observation(object):
     a set of NumPy arrays.
 
     Attributes:
-        data (ndarray): 2D array containing image data with `float` type.
+        data (ndarray): 2D array containing the raw image data in the native detector type (e.g. `uint16`), stored in
+            column-major (Fortran) order so that it can be vectorized in the row order of the bases without copying.
+        dark (float, ndarray or None): the dark offset subtracted from the raw data, either constant or a 2D array
+            matching ``data`` [optional].
+        gain (float, ndarray or None): the gain multiplying the dark-corrected data, either constant, a 1D array with
+            one entry per pixel column (e.g. a spectral response correction) or a 2D array matching ``data`` (e.g. a
+            flat-field correction) [optional].
+        rejected (int): the number of pixel values rejected as cosmic rays when the frames of the observation were
+            accumulated (see :class:`~kemitter.obsrv.accumulate.FrameAccumulator`). Initially set to 0.
         wavelength (ndarray): 1D array containing wavelength mapping data with `float` type.
         pol_angle (int or float): polarizer angle in degrees.
         filepath (str or None): path to source file containing original data [optional].
         loaded (bool): whether or not data has been loaded by a loading method. Initially set to False.
+
+    Warnings:
+        ``data`` used to hold the image as `float`. It now holds the raw, uncalibrated image in its native type and
+        column-major order, so arithmetic on ``data`` can overflow its integer type and ignores ``dark`` and ``gain``.
+        Use ``image`` (or ``vector``) for the calibrated `float` image.
     """
     def __init__(self):
         self.filepath = None
@@ -21,19 +36,20 @@ class Observation(object):
         self.wavelength = None
         self.loaded = False
         self.pol_angle = None
+        self.dark = None
+        self.gain = None
+        self.rejected = 0
+        self._frame_count = None
 
     @property
     def n_frames(self):
-        """int: the number of frames comprising the observation
+        """int: the number of frames accumulated into the observation image
 
         Raises:
             AttributeError: if no data has been loaded
-
-        Warnings:
-            Multiple frames in one observation is currently unsupported.
         """
         if self.data is not None:
-            return self.data.shape[2]
+            return self._frame_count
         else:
             raise AttributeError('No image data has been set.')
 
@@ -61,7 +77,48 @@ class Observation(object):
         else:
             raise AttributeError('No image data has been set.')
 
-    # TODO: Allow for loading of multiple frames (and sum and average options)
+    @property
+    def vector(self):
+        """ndarray: the calibrated `float` image vectorized in the row order of the bases, i.e. one pixel column after
+        another (see ``fill_vector()``)."""
+        if self.data is not None:
+            vector = np.empty(self.data.size)
+            self.fill_vector(vector)
+            return vector
+        else:
+            raise AttributeError('No image data has been set.')
+
+    @property
+    def image(self):
+        """ndarray: the calibrated 2D `float` image, i.e. ``(data - dark) * gain``, converted on access."""
+        return self.vector.reshape(self.data.shape, order='F')
+
+    def fill_vector(self, out, pixels=None):
+        """Writes the calibrated `float` image, vectorized in the row order of the bases, into a preallocated array.
+
+        The raw data is converted and dark-corrected in a single pass and the gain is applied in place, so no `float`
+        copy of the image is ever made besides ``out``.
+
+        Args:
+            out (ndarray): contiguous 1D `float` array with one entry per selected pixel.
+            pixels (tuple of int or None): the ``(begin, end)`` range of pixel columns to write [default None, all
+                pixel columns].
+        """
+        columns = slice(None) if pixels is None else slice(*pixels)
+        data = self.data[:, columns]
+        # a column-major 2D view of the output
+        image = out.reshape(data.shape, order='F')
+        if self.dark is None or np.ndim(self.dark) == 0:
+            image[...] = data
+            if self.dark is not None:
+                image -= self.dark
+        else:
+            # computed in float, so that raw pixels below a raw (e.g. uint16) dark frame do not wrap around
+            np.subtract(data, self.dark[:, columns], out=image, dtype=np.float64)
+        if self.gain is not None:
+            image *= self.gain if np.ndim(self.gain) == 0 else self.gain[..., columns]
+
+    # TODO: Allow for loading of multiple frames in the interactive loader (see from_frames() for headless loading)
     def load(self):
         """
         Launches an interactive loading session.
@@ -73,26 +130,214 @@ class Observation(object):
             Opening an interactive loader is a blocking operation, i.e. code will
             stop running until the loader is closed.
         """
+        # the interactive loader is only imported here, so that headless use does not require a GUI toolkit
+        from ..ui import LoaderUI
         loader = LoaderUI()
         if loader.success:
             self.load_from_array(loader.selected_data, loader.spe_file.wavelength,
                                  loader.pol_angle, loader.spe_file.filepath)
         return self.loaded
 
-    def load_from_array(self, data, wavelength, pol_angle, filepath=None):
+    @classmethod
+    def from_spe(cls, filepath, pol_angle, rows=None, frames=0, region=0, dark=None, gain=None, method='sum', k=3,
+                 sigma=5.0, calibration=None):
+        """Creates an observation from an SPE file, without any user interaction.
+
+        The file is memory-mapped (see :class:`~kemitter.obsrv.spe.SpeFile`), so only the selected rows of the
+        selected frames are read from disk and opening even very large kinetic series is fast. The wavelength mapping is
+        taken from the calibration stored in the file's XML footer.
+
+        Args:
+            filepath (str): path to the SPE file.
+            pol_angle (int or float): polarizer angle in degrees.
+            rows (tuple of int or None): the ``(begin, end)`` range of sensor rows to load [default None, every row].
+            frames (int or iterable of int): the frame to load, or several frames to accumulate [default 0].
+            region (int): the index of the region of interest stored in the file [default 0].
+            dark (float, ndarray or None): the dark offset of the raw data [default None, no offset].
+            gain (float or None): the gain of the dark-corrected data [default None, unit gain].
+            method (str): how several frames are combined, one of ``'sum'``, ``'mean'``, ``'median'`` or
+                ``'clipped'`` (see :class:`~kemitter.obsrv.accumulate.FrameAccumulator`) [default 'sum'].
+            k (int): the number of frames of each median block, or seeding the clipping [default 3].
+            sigma (float): the cosmic-ray rejection threshold, in units of the noise [default 5.0].
+            calibration (Calibration or None): the dark and flat-field references, cropped to ``rows`` and scaled to the
+                exposure time of the file, replacing ``dark`` and ``gain`` (see
+                :class:`~kemitter.obsrv.calibration.Calibration`) [default None].
+
+        Returns (Observation):
+            The loaded observation.
+
+        Raises:
+            ValueError: if the file has no wavelength calibration.
+        """
+        return cls.from_spe_rois(filepath, [(rows, pol_angle)], frames, region, dark, gain, method, k, sigma,
+                                 calibration)[0]
+
+    @classmethod
+    def from_spe_rois(cls, filepath, rois, frames=0, region=0, dark=None, gain=None, method='sum', k=3, sigma=5.0,
+                      calibration=None):
+        """Creates the observations of several row bands of an SPE file in a single pass over the file.
+
+        Several polarization channels can be imaged onto different row bands of the same sensor, e.g. by a Wollaston
+        prism. The band of rows spanning every region of interest is read once per frame, and every region is cut from
+        it. The observations share the wavelength array of the file, and are ready to be fitted together.
+
+        Args:
+            filepath (str): path to the SPE file.
+            rois (list of tuple): ``(rows, pol_angle)`` pairs, where ``rows`` is the ``(begin, end)`` range of sensor
+                rows of a region (or None for every row) and ``pol_angle`` its polarizer angle in degrees.
+            frames (int or iterable of int): the frame to load, or several frames to accumulate [default 0].
+            region (int): the index of the region of interest stored in the file [default 0].
+            dark (float or None): the constant dark offset of the raw data [default None, no offset].
+            gain (float or None): the constant gain of the dark-corrected data [default None, unit gain].
+            method (str): how several frames are combined, one of ``'sum'``, ``'mean'``, ``'median'`` or
+                ``'clipped'`` (see :class:`~kemitter.obsrv.accumulate.FrameAccumulator`) [default 'sum'].
+            k (int): the number of frames of each median block, or seeding the clipping [default 3].
+            sigma (float): the cosmic-ray rejection threshold, in units of the noise [default 5.0].
+            calibration (Calibration or None): the dark and flat-field references, cropped to the rows of each region
+                and scaled to the exposure time of the file, replacing ``dark`` and ``gain`` [default None].
+
+        Returns (list of Observation):
+            The loaded observations, in the order of ``rois``.
+
+        Raises:
+            ValueError: if the file has no wavelength calibration.
+        """
+        spe_file = SpeFile(filepath)
+        if spe_file.wavelength is None:
+            raise ValueError('SPE file {0} has no wavelength calibration.'.format(filepath))
+        band, slices = roi_band([rows for rows, _ in rois])
+        if not np.isscalar(frames):
+            frames = list(frames)
+        if np.isscalar(frames) or method == 'sum':
+            data = spe_file.read(band, frames, region)
+            images = [data[rows] for rows in slices]
+            rejected = [0] * len(rois)
+        else:
+            accumulators = [FrameAccumulator(method, k, sigma) for _ in rois]
+            frame_data = spe_file.frames(region)
+            for frame in frames:
+                # a single read of the band per frame
+                data = np.array(frame_data[frame, band[0]:band[1], :])
+                for accumulator, rows in zip(accumulators, slices):
+                    accumulator.add(data[rows])
+            images = [accumulator.result() for accumulator in accumulators]
+            rejected = [accumulator.rejected for accumulator in accumulators]
+        summed = 1 if np.isscalar(frames) or method != 'sum' else len(frames)
+        frame_count = 1 if np.isscalar(frames) else len(frames)
+        observations = []
+        for (rows, pol_angle), image, count in zip(rois, images, rejected):
+            observation = cls()
+            observation.load_from_array(image, spe_file.wavelength, pol_angle, filepath, dark, gain)
+            observation.rejected = count
+            observation._frame_count = frame_count
+            if calibration is not None:
+                calibration.apply(observation, rows, spe_file.exposure_time, summed)
+            observations.append(observation)
+        return observations
+
+    @classmethod
+    def from_frames(cls, frames, wavelength, pol_angle, method='sum', k=3, sigma=5.0, filepath=None, dark=None,
+                    gain=None):
+        """Creates an observation by accumulating a sequence of frames, with optional cosmic-ray rejection.
+
+        Frames are combined one at a time (see :class:`~kemitter.obsrv.accumulate.FrameAccumulator`), so ``frames``
+        can be a lazy iterable over memory-mapped frames and only a few frames are ever held in memory. The number of
+        rejected pixel values is stored in the ``rejected`` attribute.
+
+        Args:
+            frames (iterable of ndarray): the 2D frames.
+            wavelength (ndarray): 1D array containing wavelength mapping data with `float` type.
+            pol_angle (int or float): polarizer angle in degrees.
+            method (str): how the frames are combined, one of ``'sum'``, ``'mean'``, ``'median'`` or ``'clipped'``
+                [default 'sum'].
+            k (int): the number of frames of each median block, or seeding the clipping [default 3].
+            sigma (float): the cosmic-ray rejection threshold, in units of the noise [default 5.0].
+            filepath (str or None): path to source file containing original data [optional].
+            dark (float, ndarray or None): the dark offset of the combined frame [default None, no offset].
+            gain (float or None): the gain of the dark-corrected data [default None, unit gain].
+
+        Returns (Observation):
+            The loaded observation.
+        """
+        accumulator = FrameAccumulator(method, k, sigma)
+        for frame in frames:
+            accumulator.add(frame)
+        observation = cls()
+        observation.load_from_array(accumulator.result(), wavelength, pol_angle, filepath, dark, gain)
+        observation.rejected = accumulator.rejected
+        observation._frame_count = accumulator.frame_count
+        return observation
+
+    def load_from_array(self, data, wavelength, pol_angle, filepath=None, dark=None, gain=None):
         """
         Loads all required observation data into required fields from a generic NumPy array.
         Sets the `loaded` attribute to `True` upon success.
 
+        The image keeps its type (e.g. the `uint16` of raw detector frames, a quarter of the size of `float` data) and
+        is only stored in column-major order, matching the row order of the bases, so that fitting never has to reorder
+        it. It is converted to `float` and calibrated only when the observation vector of a fit is assembled.
+
         Args:
-            data (ndarray): 2D array containing image data with `float` type
+            data (ndarray): 2D array containing image data with any numeric type
             wavelength (ndarray): 1D array containing wavelength mapping data with `float` type
             pol_angle (int or float): polarizer angle in degrees
             filepath (str or None): path to source file containing original data [optional]
+            dark (float, ndarray or None): dark offset, constant or a 2D array matching ``data`` [optional]
+            gain (float, ndarray or None): gain of the dark-corrected data, constant, per pixel column or per pixel
+                [optional]
         """
+        data = np.asfortranarray(data)
+        if dark is not None and not np.isscalar(dark) and np.shape(dark) != data.shape:
+            raise ValueError('Dark frame of shape {0} does not match the image of shape {1}.'.format(
+                np.shape(dark), data.shape))
         self.data = data
+        self._frame_count = 1
+        self.dark = dark
+        self.gain = gain
         self.wavelength = wavelength
         self.pol_angle = pol_angle
         if filepath is not None:
             self.filepath = filepath
         self.loaded = True
+
+    def binned(self, factor):
+        """Bins the observation image in both the momentum and wavelength dimensions.
+
+        Blocks of ``factor X factor`` pixels of the calibrated image are summed, and each binned pixel column is mapped
+        to the mean wavelength of the columns it contains. Trailing rows and columns that do not fill a whole block are
+        dropped.
+
+        Args:
+            factor (int): the number of pixels binned together along each dimension.
+
+        Returns (Observation):
+            A new observation holding the binned image, with the same polarization angle and source file.
+        """
+        if factor < 1:
+            raise ValueError('Binning factor must be a positive integer, not {0}.'.format(factor))
+        rows = self.momentum_pixel_count // factor
+        cols = self.dispersed_pixel_count // factor
+        data = self.image[:rows * factor, :cols * factor].reshape((rows, factor, cols, factor)).sum(axis=(1, 3))
+        wavelength = np.asarray(self.wavelength[:cols * factor]).reshape((cols, factor)).mean(axis=1)
+        binned = Observation()
+        binned.load_from_array(data, wavelength, self.pol_angle, self.filepath)
+        binned._frame_count = self._frame_count
+        return binned
+
+
+def roi_band(rows):
+    """Finds the band of sensor rows spanning several regions of interest.
+
+    Args:
+        rows (list of tuple of int or None): the ``(begin, end)`` range of sensor rows of each region, None for every
+            row.
+
+    Returns (tuple of (tuple of int, list of slice)):
+        The ``(begin, end)`` range of the band (``end`` is None if a region extends to the last row) and the rows of
+        each region within the band.
+    """
+    ranges = [(0, None) if span is None else (int(span[0]), None if span[1] is None else int(span[1]))
+              for span in rows]
+    begin = min(start for start, _ in ranges)
+    end = None if any(stop is None for _, stop in ranges) else max(stop for _, stop in ranges)
+    return (begin, end), [slice(start - begin, None if stop is None else stop - begin) for start, stop in ranges]
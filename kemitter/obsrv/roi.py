@@ -0,0 +1,91 @@
+import numpy as np
+from .spe import SpeFile
+
+
+def detect_rows(image, count=1, threshold=0.5, min_rows=5, margin=0, smoothing=3):
+    """Finds the illuminated bands of sensor rows of a frame, e.g. the numerical aperture limited back focal plane.
+
+    The frame is summed over its columns into a row profile, which is smoothed and scaled between its dark level (the
+    5th percentile) and its peak (the 99th percentile). The edges of a band are where the profile crosses
+    ``threshold`` of that range, e.g. its half maximum for ``threshold=0.5``.
+
+    Args:
+        image (ndarray): the 2D frame, or its 1D row profile.
+        count (int): the number of bands to find, e.g. one per polarization channel [default 1].
+        threshold (float): the fraction of the profile range at which band edges are placed [default 0.5].
+        min_rows (int): the minimum number of rows of a band [default 5].
+        margin (int): the number of rows removed from each edge of a band, to exclude the roll-off of the edges
+            [default 0].
+        smoothing (int): the width in rows of the moving average applied to the profile [default 3].
+
+    Returns (list of tuple of int):
+        The ``(begin, end)`` range of rows of the ``count`` brightest bands, in the order of the rows, e.g. for
+        ``observation.load_from_array(image[begin:end], ...)``. Fewer bands are returned if fewer are found.
+    """
+    profile = np.asarray(image, dtype=np.float64)
+    if profile.ndim == 2:
+        profile = profile.sum(axis=1)
+    if smoothing > 1:
+        profile = np.convolve(profile, np.ones(smoothing) / smoothing, mode='same')
+    dark, peak = np.percentile(profile, (5, 99))
+    inside = profile > dark + threshold * (peak - dark)
+    # the rising and falling edges of the illuminated runs of rows
+    edges = np.diff(np.concatenate(([0], inside.astype(np.int8), [0])))
+    begins = np.flatnonzero(edges == 1) + margin
+    ends = np.flatnonzero(edges == -1) - margin
+    kept = ends - begins >= min_rows
+    begins = begins[kept]
+    ends = ends[kept]
+    signal = np.array([profile[begin:end].sum() for begin, end in zip(begins, ends)])
+    brightest = np.sort(np.argsort(signal)[::-1][:count])
+    return [(int(begins[i]), int(ends[i])) for i in brightest]
+
+
+def detect_rois(filepath, count=1, frames=None, region=0, threshold=0.5, min_rows=5, margin=0, smoothing=3,
+                tolerance=2):
+    """Finds the illuminated bands of sensor rows of an SPE file without user interaction.
+
+    The bands are detected in several frames (see :func:`detect_rows`) and checked for consistency: a frame agrees
+    when it has ``count`` bands whose edges are within ``tolerance`` rows of the median edges of all frames. The
+    returned bands are the rows illuminated in every agreeing frame.
+
+    Args:
+        filepath (str): path to the SPE file.
+        count (int): the number of bands to find, e.g. one per polarization channel [default 1].
+        frames (iterable of int or None): the frames to inspect [default None, up to 16 frames evenly spaced through
+            the file].
+        region (int): the index of the region of interest stored in the file [default 0].
+        threshold (float): the fraction of the profile range at which band edges are placed [default 0.5].
+        min_rows (int): the minimum number of rows of a band [default 5].
+        margin (int): the number of rows removed from each edge of a band [default 0].
+        smoothing (int): the width in rows of the moving average applied to the profiles [default 3].
+        tolerance (int): the maximum deviation of the edges of an agreeing frame from the median edges, in rows
+            [default 2].
+
+    Returns (list of tuple of int):
+        The ``(begin, end)`` range of rows of each band, in the order of the rows, e.g. the ``rows`` of
+        :func:`~kemitter.obsrv.observation.Observation.from_spe` or of the regions of
+        :func:`~kemitter.obsrv.observation.Observation.from_spe_rois`.
+
+    Raises:
+        ValueError: if fewer than half of the inspected frames agree on ``count`` bands.
+    """
+    spe_file = SpeFile(filepath)
+    data = spe_file.frames(region)
+    if frames is None:
+        frames = np.unique(np.linspace(0, spe_file.frame_count - 1, min(spe_file.frame_count, 16)).astype(int))
+    # the row profiles of every inspected frame, read one frame at a time
+    profiles = np.array([data[frame].sum(axis=1, dtype=np.float64) for frame in frames])
+    if not len(profiles):
+        raise ValueError('No frames of {0} to detect illuminated bands in.'.format(filepath))
+    bands = [detect_rows(profile, count, threshold, min_rows, margin, smoothing) for profile in profiles]
+    complete = np.array([band for band in bands if len(band) == count]).reshape((-1, count, 2))
+    if len(complete):
+        median = np.median(complete, axis=0)
+        complete = complete[np.all(np.abs(complete - median) <= tolerance, axis=(1, 2))]
+    if 2 * len(complete) < len(profiles):
+        raise ValueError('Only {0} of {1} frames of {2} agree on {3} illuminated bands.'.format(
+            len(complete), len(profiles), filepath, count))
+    begins = complete[:, :, 0].max(axis=0)
+    ends = complete[:, :, 1].min(axis=0)
+    return [(int(begin), int(end)) for begin, end in zip(begins, ends)]
@@ -0,0 +1,163 @@
+import numpy as np
+import xml.etree.ElementTree as ElementTree
+
+HEADER_SIZE = 4100
+
+# header field offsets of the SPE format
+_XDIM_OFFSET = 42
+_DATATYPE_OFFSET = 108
+_YDIM_OFFSET = 656
+_FOOTER_OFFSET = 678
+_FRAME_COUNT_OFFSET = 1446
+_VERSION_OFFSET = 1992
+
+_HEADER_DTYPES = {0: np.float32, 1: np.int32, 2: np.int16, 3: np.uint16, 5: np.float64, 6: np.uint8, 8: np.uint32}
+_XML_DTYPES = {'MonochromeUnsigned16': np.uint16, 'MonochromeUnsigned32': np.uint32,
+               'MonochromeFloating32': np.float32}
+
+
+class SpeFile(object):
+    """Memory-mapped reader of Princeton Instruments SPE (3.0) files.
+
+    Opening a file only reads its 4100 byte header and its XML footer. Image data is memory-mapped, so only the
+    frames and rows that are selected are ever read from disk, regardless of the size of the file.
+
+    Attributes:
+        filepath (str): the path to the SPE file.
+        version (float): the version of the SPE format.
+        dtype (dtype): the data type of the stored pixels.
+        frame_count (int): the number of frames in the file.
+        regions (list of tuple of int): the ``(height, width)`` of each region of interest stored in every frame.
+        frame_stride (int): the number of bytes between the starts of consecutive frames, including per-frame metadata.
+        wavelength (ndarray or None): 1D array of the wavelength calibration of the pixel columns of the first region,
+            or None if the file has no wavelength calibration.
+        exposure_time (float or None): the exposure time of every frame, in milliseconds, or None if the file does not
+            record it.
+    """
+    def __init__(self, filepath):
+        self.filepath = filepath
+        with open(filepath, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+            self.version = float(np.frombuffer(header, np.float32, 1, _VERSION_OFFSET)[0])
+            footer_offset = int(np.frombuffer(header, np.uint64, 1, _FOOTER_OFFSET)[0])
+            footer = None
+            if self.version >= 3 and footer_offset:
+                f.seek(footer_offset)
+                footer = ElementTree.fromstring(f.read())
+
+        self.dtype = np.dtype(_HEADER_DTYPES[int(np.frombuffer(header, np.int16, 1, _DATATYPE_OFFSET)[0])])
+        self.frame_count = int(np.frombuffer(header, np.int32, 1, _FRAME_COUNT_OFFSET)[0])
+        width = int(np.frombuffer(header, np.uint16, 1, _XDIM_OFFSET)[0])
+        height = int(np.frombuffer(header, np.uint16, 1, _YDIM_OFFSET)[0])
+        self.regions = [(height, width)]
+        self.frame_stride = height * width * self.dtype.itemsize
+        self.wavelength = None
+        self.exposure_time = None
+        if footer is not None:
+            self._read_footer(footer)
+
+    def _read_footer(self, footer):
+        frame = _find(footer, 'DataFormat', 'DataBlock')
+        if frame is not None:
+            self.frame_count = int(frame.get('count', self.frame_count))
+            self.frame_stride = int(frame.get('stride', self.frame_stride))
+            if frame.get('pixelFormat') in _XML_DTYPES:
+                self.dtype = np.dtype(_XML_DTYPES[frame.get('pixelFormat')])
+            regions = [child for child in frame if _tag(child) == 'DataBlock' and child.get('type') == 'Region']
+            if regions:
+                self.regions = [(int(region.get('height')), int(region.get('width'))) for region in regions]
+        wavelength = _find(footer, 'Calibrations', 'WavelengthMapping', 'Wavelength')
+        values = None
+        if wavelength is not None and wavelength.text:
+            values = np.array([float(value) for value in wavelength.text.strip().split(',') if value.strip()])
+        else:
+            # space-separated 'wavelength,error' pairs
+            wavelength = _find(footer, 'Calibrations', 'WavelengthMapping', 'WavelengthError')
+            if wavelength is not None and wavelength.text:
+                values = np.array([float(pair.split(',')[0]) for pair in wavelength.text.split()])
+        if values is not None:
+            # the calibration covers the sensor, so it is cropped and binned to the stored region
+            mapping = _find(footer, 'Calibrations', 'SensorMapping')
+            width = self.regions[0][1]
+            if mapping is not None and len(values) != width:
+                begin = int(mapping.get('x', 0))
+                binning = int(mapping.get('xBinning', 1))
+                values = values[begin:begin + width * binning].reshape((width, binning)).mean(axis=1)
+            self.wavelength = values
+        exposure = _find(footer, 'ExposureTime')
+        if exposure is not None and exposure.text:
+            self.exposure_time = float(exposure.text)
+
+    def frames(self, region=0):
+        """Memory-maps the image data of one region of every frame.
+
+        Args:
+            region (int): the index of the region of interest [default 0].
+
+        Returns (memmap):
+            A read-only 3D ``(frame_count, height, width)`` array. No data is read until it is indexed.
+        """
+        if self.frame_stride % self.dtype.itemsize:
+            raise ValueError('Frame stride of {0} bytes is not a multiple of the pixel size.'.format(self.frame_stride))
+        offset = sum(height * width for height, width in self.regions[:region])
+        height, width = self.regions[region]
+        data = np.memmap(self.filepath, dtype=self.dtype, mode='r', offset=HEADER_SIZE,
+                         shape=(self.frame_count, self.frame_stride // self.dtype.itemsize))
+        return data[:, offset:offset + height * width].reshape((self.frame_count, height, width))
+
+    def read(self, rows=None, frames=0, region=0):
+        """Reads a range of rows of one or several frames.
+
+        Args:
+            rows (tuple of int or None): the ``(begin, end)`` range of rows to read [default None, every row].
+            frames (int or iterable of int): the index of the frame to read, or the indices of several frames, which
+                are summed [default 0].
+            region (int): the index of the region of interest [default 0].
+
+        Returns (ndarray):
+            The 2D image of the selected rows, in the stored pixel type for a single frame. Several frames are summed in
+            the type given by ``accumulation_dtype()``, so that the sum cannot overflow the pixel type.
+        """
+        data = self.frames(region)
+        rows = slice(None) if rows is None else slice(*rows)
+        if np.isscalar(frames):
+            return np.array(data[frames, rows, :])
+        image = None
+        for frame in frames:
+            if image is None:
+                image = np.array(data[frame, rows, :], dtype=accumulation_dtype(self.dtype))
+            else:
+                image += data[frame, rows, :]
+        if image is None:
+            raise ValueError('At least one frame must be selected.')
+        return image
+
+
+def accumulation_dtype(dtype):
+    """Chooses the type in which frames of a pixel type are summed.
+
+    Args:
+        dtype (dtype): the pixel type of the frames.
+
+    Returns (dtype):
+        `uint32` for 8 and 16 bit unsigned pixels, which holds the sum of at least 65537 frames at a fraction of the
+        size of `float` data, and `float64` otherwise.
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'u' and dtype.itemsize <= 2:
+        return np.dtype(np.uint32)
+    return np.dtype(np.float64)
+
+
+def _tag(element):
+    # the tag name of an XML element, without its namespace
+    return element.tag.rsplit('}', 1)[-1]
+
+
+def _find(element, *path):
+    # finds the first descendant along a path of tag names, ignoring namespaces
+    for name in path:
+        element = next((child for child in element.iter() if child is not element and _tag(child) == name), None)
+        if element is None:
+            return None
+    return element
@@ -0,0 +1,196 @@
+import os
+import glob
+import threading
+import numpy as np
+from queue import Queue, Full
+from .spe import SpeFile
+from .accumulate import FrameAccumulator
+from .observation import Observation, roi_band
+
+_END = object()  # marks the end of a prefetched stream
+
+
+class ObservationStream(object):
+    """Lazy frame-by-frame reader of one or several SPE files, for fitting long acquisitions with bounded memory.
+
+    Iterating over the stream yields ``(index, data, wavelength)`` tuples, where ``index`` counts the frames of all
+    files in order, ``data`` is the 2D image of the selected rows of the frame, in the stored pixel type, and
+    ``wavelength`` is the wavelength calibration of its file. Files are memory-mapped (see
+    :class:`~kemitter.obsrv.spe.SpeFile`), so a frame is only read from disk when it is reached.
+
+    With ``prefetch > 0``, frames are read on a background thread while the previous ones are being fitted. At most
+    ``prefetch`` frames are held ahead of the consumer: the reader blocks while the buffer is full, so a slow fitting
+    loop throttles the reads instead of accumulating frames in memory.
+
+    The source is an SPE file, a list of SPE files, or a directory whose files matching ``pattern`` are read in sorted
+    order.
+
+    Attributes:
+        filepaths (list of str): the SPE files of the stream, in reading order.
+        rows (tuple of int or None): the ``(begin, end)`` range of sensor rows read from every frame.
+        region (int): the index of the region of interest read from every file.
+        prefetch (int): the maximum number of frames read ahead on a background thread (0 reads on demand).
+    """
+    def __init__(self, source, rows=None, region=0, prefetch=0, pattern='*.spe'):
+        if isinstance(source, str):
+            if os.path.isdir(source):
+                source = sorted(glob.glob(os.path.join(source, pattern)))
+            else:
+                source = [source]
+        self.filepaths = list(source)
+        if not self.filepaths:
+            raise ValueError('No SPE files to stream.')
+        if prefetch < 0:
+            raise ValueError('Prefetch depth must be non-negative, not {0}.'.format(prefetch))
+        self.rows = rows
+        self.region = region
+        self.prefetch = prefetch
+
+    @property
+    def frame_count(self):
+        """int: the total number of frames of all files (only their headers and footers are read)."""
+        return sum(SpeFile(filepath).frame_count for filepath in self.filepaths)
+
+    def __iter__(self):
+        return ((index, data, spe_file.wavelength) for index, data, spe_file in self._iterate(self._file_frames()))
+
+    def observations(self, pol_angle, frames_per_observation=1, dark=None, gain=None, method='sum', k=3, sigma=5.0,
+                     calibration=None):
+        """Groups the frames of the stream into observations.
+
+        Consecutive frames are accumulated into one observation, with optional cosmic-ray rejection (see
+        :class:`~kemitter.obsrv.accumulate.FrameAccumulator`). A trailing group with fewer frames is dropped, as is a
+        group that would span two files. Combine with :func:`~kemitter.model.fit_many` for parallel fitting, e.g.
+        ``fit_many(model, store, ((key, [obs]) for obs in stream.observations(0)))``, whose bound on the jobs in flight
+        then also bounds the frames read ahead.
+
+        Args:
+            pol_angle (int or float): the polarizer angle of the observations, in degrees.
+            frames_per_observation (int): the number of consecutive frames accumulated into each observation
+                [default 1].
+            dark (float, ndarray or None): the dark offset of the accumulated frames [default None, no offset].
+            gain (float or None): the gain of the dark-corrected frames [default None, unit gain].
+            method (str): how the frames are combined, one of ``'sum'``, ``'mean'``, ``'median'`` or ``'clipped'``
+                [default 'sum'].
+            k (int): the number of frames of each median block, or seeding the clipping [default 3].
+            sigma (float): the cosmic-ray rejection threshold, in units of the noise [default 5.0].
+            calibration (Calibration or None): the dark and flat-field references, cropped to the rows of the stream
+                and scaled to the exposure time of each file, replacing ``dark`` and ``gain`` (see
+                :class:`~kemitter.obsrv.calibration.Calibration`) [default None].
+
+        Yields (Observation):
+            The observation of every group of frames, in order.
+        """
+        for observations in self.observation_sets([(self.rows, pol_angle)], frames_per_observation, dark, gain,
+                                                  method, k, sigma, calibration):
+            yield observations[0]
+
+    def observation_sets(self, rois, frames_per_observation=1, dark=None, gain=None, method='sum', k=3, sigma=5.0,
+                         calibration=None):
+        """Groups the frames of the stream into the observations of several row bands of the sensor.
+
+        Every frame is read once, as the band of rows spanning all regions of interest, and each region is cut from it
+        and accumulated separately (see :func:`observations`). The ``rows`` of the stream are ignored.
+
+        Args:
+            rois (list of tuple): ``(rows, pol_angle)`` pairs, where ``rows`` is the ``(begin, end)`` range of sensor
+                rows of a region (or None for every row) and ``pol_angle`` its polarizer angle in degrees.
+            frames_per_observation (int): the number of consecutive frames accumulated into each observation
+                [default 1].
+            dark (float or None): the constant dark offset of the accumulated frames [default None, no offset].
+            gain (float or None): the constant gain of the dark-corrected frames [default None, unit gain].
+            method (str): how the frames are combined, one of ``'sum'``, ``'mean'``, ``'median'`` or ``'clipped'``
+                [default 'sum'].
+            k (int): the number of frames of each median block, or seeding the clipping [default 3].
+            sigma (float): the cosmic-ray rejection threshold, in units of the noise [default 5.0].
+            calibration (Calibration or None): the dark and flat-field references, cropped to the rows of each region
+                and scaled to the exposure time of each file, replacing ``dark`` and ``gain`` [default None].
+
+        Yields (list of Observation):
+            The observations of every group of frames, in the order of ``rois``.
+        """
+        if frames_per_observation < 1:
+            raise ValueError('Frames per observation must be a positive integer, not {0}.'.format(
+                frames_per_observation))
+        band, slices = roi_band([rows for rows, _ in rois])
+        accumulators = None
+        for _, data, spe_file in self._iterate(self._file_frames(band)):
+            if accumulators is not None and spe_file is not current:
+                accumulators = None
+            if accumulators is None:
+                accumulators = [FrameAccumulator(method, k, sigma) for _ in rois]
+                current = spe_file
+            for accumulator, rows in zip(accumulators, slices):
+                accumulator.add(data[rows])
+            if accumulators[0].frame_count == frames_per_observation:
+                observations = []
+                for (rows, pol_angle), accumulator in zip(rois, accumulators):
+                    observation = Observation()
+                    observation.load_from_array(accumulator.result(), spe_file.wavelength, pol_angle,
+                                                spe_file.filepath, dark, gain)
+                    observation.rejected = accumulator.rejected
+                    observation._frame_count = accumulator.frame_count
+                    if calibration is not None:
+                        summed = frames_per_observation if method == 'sum' else 1
+                        calibration.apply(observation, rows, spe_file.exposure_time, summed)
+                    observations.append(observation)
+                yield observations
+                accumulators = None
+
+    def _iterate(self, frames):
+        # reads the frames on a background thread if prefetching
+        if self.prefetch:
+            return _prefetched(frames, self.prefetch)
+        return frames
+
+    def _file_frames(self, rows=None):
+        # yields (index, data, SPE file) for every frame, reading the given rows [default the rows of the stream]
+        index = 0
+        rows = self.rows if rows is None else rows
+        rows = slice(None) if rows is None else slice(*rows)
+        for filepath in self.filepaths:
+            spe_file = SpeFile(filepath)
+            data = spe_file.frames(self.region)
+            for frame in range(spe_file.frame_count):
+                yield index, np.array(data[frame, rows, :]), spe_file
+                index += 1
+
+
+def _prefetched(frames, depth):
+    # yields the items of an iterator that is consumed on a background thread, at most `depth` items ahead
+    queue = Queue(maxsize=depth)
+    stopped = threading.Event()
+
+    def put(item):
+        # blocks while the queue is full, unless the consumer stopped
+        while not stopped.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def read():
+        try:
+            for item in frames:
+                if not put((item, None)):
+                    return
+        except Exception as error:
+            put((None, error))
+            return
+        put((_END, None))
+
+    thread = threading.Thread(target=read, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = queue.get()
+            if error is not None:
+                raise error
+            if item is _END:
+                return
+            yield item
+    finally:
+        stopped.set()
+        thread.join()
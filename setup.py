@@ -31,5 +31,8 @@ setup(
         'spe2py',
         'scipy',
         'numpy'
-    ]
+    ],
+    extras_require={
+        'store': ['h5py']
+    }
 )
\ No newline at end of file